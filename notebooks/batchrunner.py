@@ -26,16 +26,21 @@ put the code inside an ``if __name__ == '__main__':`` code black as shown below:
 
 """
 
+from __future__ import annotations
+
+import inspect
 import itertools
 import multiprocessing
+import os
+from collections import Counter
 from collections.abc import Iterable, Mapping
 from functools import partial
 from multiprocessing import Pool
-from typing import Any, Tuple, Dict
-
-from tqdm.auto import tqdm
+from typing import TYPE_CHECKING, Any, Tuple, Dict
 
-from mesa.model import Model
+if TYPE_CHECKING:
+    # only needed for annotations; spawned workers import the model module themselves
+    from mesa.model import Model
 
 multiprocessing.set_start_method("spawn", force=True)
 
@@ -49,7 +54,12 @@ def batch_run(
         data_collection_period: int = -1,
         max_steps: int = 1000,
         display_progress: bool = True,
-) -> list[dict[str, Any]]:
+        metrics: str | None = None,
+        cluster_history_dir: str | None = None,
+        share_topology: bool = True,
+        agent_history_dir: str | None = None,
+        compact: bool = False,
+) -> list[dict[str, Any]] | dict[str, list[dict[str, Any]]]:
     """Batch run a mesa model with a set of parameter values. Customized to collect datacollector table data as well.
 
     Args:
@@ -60,9 +70,25 @@ def batch_run(
         data_collection_period (int, optional): Number of steps after which data gets collected, by default -1 (end of episode)
         max_steps (int, optional): Maximum number of model steps after which the model halts, by default 1000
         display_progress (bool, optional): Display batch run process, by default True
+        metrics (str, optional): NDJSON file path or "udp://host:port" that every run streams its per-step
+            metrics to (see src.monitor), labelled "run-<RunId>". By default None (no live feed)
+        cluster_history_dir (str, optional): Directory to save each run's per-step cluster assignments to, as
+            run-<RunId>.npz (see src.clusterstore). Rows reference the file in a "ClusterHistory" column.
+            By default None (cluster assignments are not kept)
+        share_topology (bool, optional): Build every network used by more than one run only once, in this
+            process, and hand it to the runs instead of letting each of them generate it again. With several
+            processes the network is published in shared memory that workers attach to without copying.
+            Only applies to models with a `make_topology` method and runs with a fixed seed. By default True
+        agent_history_dir (str, optional): Directory to save each run's per-agent reach history to, as
+            run-<RunId>.reach.npz (see src.history). Rows reference the file in a "ReachHistory" column. Rows
+            always get per-step reach summaries (Reach_Mean, Reach_Q10, Reach_Median, Reach_Q90) instead.
+            By default None (the per-agent history is not kept)
+        compact (bool, optional): Return {"runs": [...], "steps": [...]} with the run-level columns (RunId,
+            iteration, StopReason, history files and parameters) once per run, and only RunId plus the
+            collected values in the per-step rows, instead of repeating them in every row. By default False
 
     Returns:
-        List[Dict[str, Any]]
+        List[Dict[str, Any]], or with compact a dict of run and step rows that join on RunId
 
     Notes:
         batch_run assumes the model has a `datacollector` attribute that has a DataCollector object initialized.
@@ -72,33 +98,119 @@ def batch_run(
     run_id = 0
     for iteration in range(iterations):
         for kwargs in _make_model_kwargs(parameters):
-            runs_list.append((run_id, iteration, kwargs))
+            runs_list.append((run_id, iteration, kwargs, None))
             run_id += 1
 
+    shared = {}
+    if share_topology and hasattr(model_cls, "make_topology"):
+        runs_list, shared = _share_topologies(model_cls, runs_list, publish=number_processes != 1)
+
     process_func = partial(
         _model_run_func,
         model_cls,
         max_steps=max_steps,
         data_collection_period=data_collection_period,
+        metrics=metrics,
+        cluster_history_dir=cluster_history_dir,
+        agent_history_dir=agent_history_dir,
+        compact=compact,
     )
 
     results: list[dict[str, Any]] = []
+    runs: list[dict[str, Any]] = []
 
-    with tqdm(total=len(runs_list), disable=not display_progress) as pbar:
-        if number_processes == 1:
-            for run in runs_list:
-                data = process_func(run)
-                results.extend(data)
-                pbar.update()
-        else:
-            with Pool(number_processes) as p:
-                for data in p.imap_unordered(process_func, runs_list):
-                    results.extend(data)
-                    pbar.update()
+    # the progress bar is only needed in the parent process, so workers never import tqdm
+    from tqdm.auto import tqdm
 
+    try:
+        with tqdm(total=len(runs_list), disable=not display_progress) as pbar:
+            if number_processes == 1:
+                for run in runs_list:
+                    data = process_func(run)
+                    _add_run_data(data, results, runs, compact)
+                    pbar.update()
+            else:
+                with Pool(number_processes) as p:
+                    for data in p.imap_unordered(process_func, runs_list):
+                        _add_run_data(data, results, runs, compact)
+                        pbar.update()
+    finally:
+        for topology in shared.values():
+            topology.close()
+
+    if compact:
+        return {"runs": runs, "steps": results}
     return results
 
 
+def _add_run_data(data, results, runs, compact):
+    if compact:
+        run_data, data = data
+        runs.append(run_data)
+    results.extend(data)
+
+
+def _topology_key(
+        model_cls: type[Model],
+        kwargs: dict[str, Any],
+) -> tuple | None:
+    """Parameters the network of a run depends on, or None when the run generates its own random network."""
+    arguments = inspect.signature(model_cls).bind_partial(**kwargs)
+    arguments.apply_defaults()
+    arguments = arguments.arguments
+    # prebuilt graphs are already shared (memory-mapped files), unseeded ones differ on every run
+    if arguments.get("graph") is not None or arguments.get("seed") is None:
+        return None
+    return arguments["num_nodes"], arguments["avg_node_degree"], arguments["seed"]
+
+
+def _share_topologies(
+        model_cls: type[Model],
+        runs_list: list[tuple[int, int, dict[str, Any], Any]],
+        publish: bool,
+) -> tuple[list[tuple[int, int, dict[str, Any], Any]], dict[tuple, Any]]:
+    """Build every network used by more than one run once and attach it to those runs.
+
+    Runs get the Topology itself, or with <publish> the spec of a SharedTopology for workers to attach to.
+    Returns the updated runs and the SharedTopology objects the caller has to close.
+    """
+    from src.topology import SharedTopology
+
+    keys = [_topology_key(model_cls, kwargs) for _, _, kwargs, _ in runs_list]
+    counts = Counter(key for key in keys if key is not None)
+
+    topologies = {}
+    shared = {}
+    for key, count in counts.items():
+        if count < 2:
+            continue
+        topology = model_cls.make_topology(*key)
+        if publish:
+            shared[key] = SharedTopology(topology)
+            topology = shared[key].spec
+        topologies[key] = topology
+
+    runs_list = [
+        (run_id, iteration, kwargs, topologies.get(key))
+        for (run_id, iteration, kwargs, _), key in zip(runs_list, keys)
+    ]
+    return runs_list, shared
+
+
+# shared topologies this worker process has attached to, by block names
+_attached: dict[tuple, Any] = {}
+
+
+def _attach_topology(spec: dict[str, Any]):
+    """Topology of a shared memory spec, attached once per worker process and reused by later runs."""
+    key = tuple(block_name for block_name, _, _ in spec.values())
+    if key not in _attached:
+        from src.topology import SharedTopology
+
+        _attached[key] = SharedTopology.attach(spec)
+    return _attached[key]
+
+
 def _make_model_kwargs(
         parameters: Mapping[str, Any | Iterable[Any]],
 ) -> list[dict[str, Any]]:
@@ -145,33 +257,83 @@ def _make_model_kwargs(
 
 def _model_run_func(
         model_cls: type[Model],
-        run: tuple[int, int, dict[str, Any]],
+        run: tuple[int, int, dict[str, Any], Any],
         max_steps: int,
         data_collection_period: int,
-) -> list[dict[str, Any]]:
+        metrics: str | None = None,
+        cluster_history_dir: str | None = None,
+        agent_history_dir: str | None = None,
+        compact: bool = False,
+) -> list[dict[str, Any]] | tuple[dict[str, Any], list[dict[str, Any]]]:
     """Run a single model run and collect model and agent data.
 
     Parameters
     ----------
     model_cls : Type[Model]
         The model class to batch-run
-    run: Tuple[int, int, Dict[str, Any]]
-        The run id, iteration number, and kwargs for this run
+    run: Tuple[int, int, Dict[str, Any], Any]
+        The run id, iteration number, kwargs for this run, and the prebuilt network to run on: a Topology,
+        the spec of a SharedTopology, or None for the model to generate its own
     max_steps : int
         Maximum number of model steps after which the model halts, by default 1000
     data_collection_period : int
         Number of steps after which data gets collected
+    metrics : str, optional
+        Target of a MetricsEmitter the model publishes its per-step metrics to
+    cluster_history_dir : str, optional
+        Directory to save the model's cluster history to
+    agent_history_dir : str, optional
+        Directory to save the model's reach history to
+    compact : bool
+        Return the run-level columns separately instead of in every row
 
     Returns:
     -------
     List[Dict[str, Any]]
-        Return model_data, agent_data, table_data from the reporters
+        Return model_data, agent_data, table_data from the reporters. With compact, a (run data, rows) tuple
     """
-    run_id, iteration, kwargs = run
-    model = model_cls(**kwargs)
+    run_id, iteration, kwargs, topology = run
+    model_kwargs = dict(kwargs)
+    if isinstance(topology, dict):
+        topology = _attach_topology(topology)
+    if topology is not None:
+        model_kwargs["graph"] = topology
+    emitter = None
+    if metrics is not None:
+        from src.monitor import MetricsEmitter
+
+        emitter = MetricsEmitter(metrics, label=f"run-{run_id}")
+        model_kwargs["metrics"] = emitter
+    model = model_cls(**model_kwargs)
     while model.running and model.steps <= max_steps:
         model.step()
-
+    if hasattr(model, "close"):
+        # a run cut off at max_steps was not closed by the model itself, e.g. its event log is not saved yet
+        model.close()
+    if emitter is not None:
+        emitter.close()
+    # why the run ended; runs still going at max_steps were cut off by the batch runner
+    stop_reason = getattr(model, "stop_reason", None) if not model.running else "max_steps"
+
+    cluster_history = None
+    if cluster_history_dir is not None and hasattr(model, "cluster_history"):
+        cluster_history = os.path.join(cluster_history_dir, f"run-{run_id}.npz")
+        model.cluster_history.save(cluster_history)
+
+    reach_history = None
+    if agent_history_dir is not None and hasattr(model, "reach_history"):
+        reach_history = os.path.join(agent_history_dir, f"run-{run_id}.reach.npz")
+        model.reach_history.save(reach_history)
+    reach_summary = _reach_summary(model)
+
+    run_data = {
+        "RunId": run_id,
+        "iteration": iteration,
+        "StopReason": stop_reason,
+        "ClusterHistory": cluster_history,
+        "ReachHistory": reach_history,
+        **kwargs,
+    }
     data = []
 
     steps = list(range(0, model.steps, data_collection_period))
@@ -180,16 +342,15 @@ def _model_run_func(
 
     for step in steps:
         model_data, all_agents_data, table_data = _collect_data(model, step)
+        summary_data = {name: values[step] for name, values in reach_summary.items()}
 
         # If there are agent_reporters, then create an entry for each agent
         if all_agents_data:
             stepdata = [
                 {
-                    "RunId": run_id,
-                    "iteration": iteration,
                     "Step": step,
-                    **kwargs,
                     **model_data,
+                    **summary_data,
                     **agent_data,
                     **table_data
                 }
@@ -199,17 +360,26 @@ def _model_run_func(
         else:
             stepdata = [
                 {
-                    "RunId": run_id,
-                    "iteration": iteration,
                     "Step": step,
-                    **kwargs,
                     **model_data,
+                    **summary_data,
                     **table_data
                 }
             ]
         data.extend(stepdata)
 
-    return data
+    if compact:
+        return run_data, [{"RunId": run_id, **row} for row in data]
+    return [{"RunId": run_id, "iteration": iteration, "Step": row["Step"], **run_data, **row} for row in data]
+
+
+def _reach_summary(model: Model) -> dict[str, Any]:
+    """Per-step summaries of the model's per-agent reach history, if it keeps one."""
+    history = getattr(model, "reach_history", None)
+    if history is None or not len(history.agents):
+        return {}
+    q10, median, q90 = history.quantiles((0.1, 0.5, 0.9)).tolist()
+    return {"Reach_Mean": history.mean().tolist(), "Reach_Q10": q10, "Reach_Median": median, "Reach_Q90": q90}
 
 
 def _collect_data(
@@ -230,11 +400,11 @@ def _collect_data(
     #   tables dict maps names of tables to dict of columns
     #       dict of columns maps column names to list of values for each step
 
-    # get tables and for each table, get data per step
+    # get tables and for each table, get data per step. tables get one row per step, like model_vars
     for title, columns in dc.tables.items():
         for col, vals in columns.items():
-            for val in vals:
-                table_data.update({f"{title}_{str(col)}": val})
+            if vals:
+                table_data[f"{title}_{str(col)}"] = vals[min(step, len(vals) - 1)]
 
     all_agents_data = []
     raw_agent_data = dc._agent_records.get(step, [])
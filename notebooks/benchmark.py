@@ -0,0 +1,103 @@
+"""Benchmark for the TikTokEchoChamber model.
+
+Measures how long a fresh interpreter takes to import the headless model (the cost every
+spawned batch worker pays), how long model construction takes and how fast the model steps.
+Run from the repository root::
+
+    python notebooks/benchmark.py --nodes 200 1000 --steps 20
+
+The import check fails (exit code 1) when importing the model core takes longer than
+``--import-budget`` seconds or pulls in visualization modules.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# modules that only the Solara app needs; a headless import must never load them
+VIZ_MODULES = ("matplotlib", "solara", "mesa.visualization")
+
+IMPORT_SCRIPT = """
+import sys, time
+t = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - t
+print(elapsed)
+print(",".join(m for m in {viz!r} if m in sys.modules))
+"""
+
+
+def measure_import(module, cwd=ROOT):
+    """Import <module> in a fresh interpreter and return (seconds, loaded visualization modules)."""
+    out = subprocess.run(
+        [sys.executable, "-c", IMPORT_SCRIPT.format(module=module, viz=VIZ_MODULES)],
+        cwd=cwd, capture_output=True, text=True, check=True,
+    ).stdout.split("\n")
+    return float(out[0]), [m for m in out[1].split(",") if m]
+
+
+def check_import_budget(budget):
+    """Check that the headless entry points import within <budget> seconds without visualization modules."""
+    ok = True
+    for module, cwd in (("src.model", ROOT), ("batchrunner", os.path.join(ROOT, "notebooks"))):
+        # take the best of a few runs to smooth out disk cache effects
+        timings = []
+        for _ in range(3):
+            elapsed, viz = measure_import(module, cwd)
+            timings.append(elapsed)
+        best = min(timings)
+        status = "ok"
+        if best > budget:
+            status = f"OVER BUDGET ({budget:.2f}s)"
+            ok = False
+        if viz:
+            status = f"loads visualization modules: {viz}"
+            ok = False
+        print(f"import {module:<12} {best:.3f}s  {status}")
+    return ok
+
+
+def bench_model(num_nodes, steps, avg_node_degree, seed):
+    from src.model import TikTokEchoChamber
+
+    t = time.perf_counter()
+    model = TikTokEchoChamber(
+        num_nodes=num_nodes,
+        avg_node_degree=avg_node_degree,
+        num_cons_bots=max(2, num_nodes // 20),
+        num_prog_bots=max(2, num_nodes // 20),
+        seed=seed,
+    )
+    build = time.perf_counter() - t
+
+    t = time.perf_counter()
+    for _ in range(steps):
+        model.step()
+    run = time.perf_counter() - t
+    print(f"nodes={num_nodes:<8} build {build:8.3f}s  step {run / steps * 1000:9.2f}ms  ({steps / run:8.1f} steps/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--nodes", type=int, nargs="+", default=[100, 1000])
+    parser.add_argument("--steps", type=int, default=10)
+    parser.add_argument("--avg-node-degree", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--import-budget", type=float, default=2.0,
+                        help="max seconds a fresh interpreter may spend importing the model core")
+    args = parser.parse_args()
+
+    ok = check_import_budget(args.import_budget)
+    for num_nodes in args.nodes:
+        bench_model(num_nodes, args.steps, args.avg_node_degree, args.seed)
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+"""Complexity checks for the hot paths of the TikTokEchoChamber model.
+
+Where benchmark.py reports how fast the model is, this script checks how its hot paths scale. Every check
+runs one hot path on synthetic inputs of growing size (nodes, edges or collected steps), measures it twice:
+
+- operations: the number of Python lines and calls executed (counted with sys.settrace), which is exact and
+  machine independent, but blind to work done inside C functions such as list.count
+- time: the best of a few CPU time measurements, which also sees the work done in C, but is noisier (cache
+  effects make larger inputs a bit slower per item even on linear paths)
+
+and fits the scaling exponent k of cost ~ size^k on a log-log scale. A check fails when the operations
+exponent is above ``--max-exponent`` or the time exponent above ``--max-time-exponent``, so a quadratic
+accident (k close to 2) fails the run while linear paths (k close to 1) pass. Run from the repository root::
+
+    python notebooks/perfcheck.py
+    python notebooks/perfcheck.py --sizes 1000 2000 4000 8000 16000 --max-exponent 1.1
+
+The exit code is 1 when a check fails. ``--canary`` adds a deliberately quadratic cluster count to check
+that the harness still catches one.
+"""
+
+import argparse
+import gc
+import os
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "notebooks"))
+
+from src.agents import EDGE_WEIGHTS, State  # noqa: E402
+from src.model import TikTokEchoChamber, get_unique_edge_list, identify_clusters  # noqa: E402
+
+
+def count_ops(func):
+    """Number of Python lines and calls executed by func()."""
+    ops = 0
+
+    def tracer(frame, event, arg):
+        nonlocal ops
+        ops += 1
+        return tracer
+
+    sys.settrace(tracer)
+    try:
+        func()
+    finally:
+        sys.settrace(None)
+    return ops
+
+
+def best_time(func, repeat=5, min_total=0.2):
+    """Best CPU time of at least <repeat> calls of func(), calling it until <min_total> seconds were spent,
+    without garbage collection pauses (like timeit)."""
+    best = float("inf")
+    total = 0
+    calls = 0
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        while calls < repeat or total < min_total:
+            t = time.process_time()
+            func()
+            elapsed = time.process_time() - t
+            best = min(best, elapsed)
+            total += elapsed
+            calls += 1
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return best
+
+
+def fit_exponent(sizes, costs):
+    """Slope of log(cost) against log(size)."""
+    return float(np.polyfit(np.log(sizes), np.log(np.maximum(costs, 1e-9)), 1)[0])
+
+
+def synthetic_model(num_nodes, avg_node_degree, seed):
+    """Model whose agents have random states and whose edges have random weights, like a model some steps in."""
+    model = TikTokEchoChamber(
+        num_nodes=num_nodes,
+        avg_node_degree=avg_node_degree,
+        num_cons_bots=max(2, num_nodes // 20),
+        num_prog_bots=max(2, num_nodes // 20),
+        seed=seed,
+    )
+    rng = np.random.default_rng(seed)
+    for agent, state in zip(model.agent_at, rng.integers(len(State), size=num_nodes).tolist()):
+        agent.set_state(State(state))
+        agent.reach = int(rng.integers(1, avg_node_degree + 1))
+    model.edge_weight[:] = rng.integers(len(EDGE_WEIGHTS), size=len(model.edge_weight))
+    return model
+
+
+# Every check maps an input size to a (size, function) pair, where size is what the path should scale
+#   linearly in (nodes, directed edges or steps)
+
+def check_identify_clusters(num_nodes, args):
+    model = synthetic_model(num_nodes, args.avg_node_degree, args.seed)
+    return num_nodes, lambda: identify_clusters(model)
+
+
+def check_neighbour_helpers(num_nodes, args):
+    # every helper once for every agent: linear in edges, since each agent only looks at its own neighbours
+    model = synthetic_model(num_nodes, args.avg_node_degree, args.seed)
+
+    def run():
+        for agent in model.agent_at:
+            agent.get_neighbours()
+            agent.get_dissimilar_human_neighbours()
+            next(agent.iter_dissimilar_human_neighbours(), None)
+            agent.get_similar_neighbours()
+            agent.get_similar_human_neighbours()
+            agent.get_similar_bot_neighbours()
+
+    return len(model.topology.indices), run
+
+
+def check_reporters(num_nodes, args):
+    model = synthetic_model(num_nodes, args.avg_node_degree, args.seed)
+    reporters = list(model.datacollector.model_reporters.values())
+
+    def run():
+        for reporter in reporters:
+            reporter(model)
+
+    return num_nodes, run
+
+
+def check_unique_edges(num_nodes, args):
+    model = synthetic_model(num_nodes, args.avg_node_degree, args.seed)
+    topology = model.topology
+    edges = list(zip(topology.sources.tolist(), topology.indices.tolist()))
+    return len(edges), lambda: get_unique_edge_list(edges)
+
+
+def check_collect_data(num_nodes, args):
+    # batch_run reads back every collected step: linear in steps. The size is used as the number of steps,
+    #   collected on a small model
+    from batchrunner import _collect_data
+
+    steps = num_nodes // 10
+    model = synthetic_model(100, args.avg_node_degree, args.seed)
+    for _ in range(steps):
+        model.steps += 1
+        model.record_clusters()
+        model.datacollector.collect(model)
+        model.record_reach()
+
+    def run():
+        for step in range(model.steps + 1):
+            _collect_data(model, step)
+
+    return model.steps + 1, run
+
+
+def check_canary(num_nodes, args):
+    # cluster sizes with list.count, quadratic in nodes but with a constant number of Python operations
+    #   per cluster, so only the timing should catch it
+    labels = identify_clusters(synthetic_model(num_nodes, args.avg_node_degree, args.seed)).labels.tolist()
+    return num_nodes, lambda: [labels.count(label) for label in set(labels)]
+
+
+CHECKS = {
+    "identify_clusters": check_identify_clusters,
+    "neighbour_helpers": check_neighbour_helpers,
+    "reporters": check_reporters,
+    "get_unique_edge_list": check_unique_edges,
+    "_collect_data": check_collect_data,
+}
+
+
+def run_check(name, check, args):
+    sizes, ops, times = [], [], []
+    for num_nodes in args.sizes:
+        size, func = check(num_nodes, args)
+        func()  # warm up caches (lazy topology arrays, imports)
+        sizes.append(size)
+        ops.append(count_ops(func))
+        times.append(best_time(func, args.repeat))
+    ops_exponent = fit_exponent(sizes, ops)
+    time_exponent = fit_exponent(sizes, times)
+    ok = ops_exponent <= args.max_exponent and time_exponent <= args.max_time_exponent
+    status = "ok" if ok else f"SUPERLINEAR (max n^{args.max_exponent:.2f} ops, n^{args.max_time_exponent:.2f} time)"
+    print(f"{name:<22} ops ~ n^{ops_exponent:.2f}  time ~ n^{time_exponent:.2f}  "
+          f"({ops[-1]} ops, {times[-1] * 1000:.2f}ms at {sizes[-1]})  {status}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 2000, 4000, 8000],
+                        help="number of nodes of the synthetic graphs (steps / 10 for _collect_data)")
+    parser.add_argument("--avg-node-degree", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=5, help="least timings per size, the best one is kept")
+    parser.add_argument("--max-exponent", type=float, default=1.2,
+                        help="largest scaling exponent of the operations count a hot path may have")
+    parser.add_argument("--max-time-exponent", type=float, default=1.5,
+                        help="largest scaling exponent of the time a hot path may have")
+    parser.add_argument("--only", nargs="+", choices=list(CHECKS), help="run only these checks")
+    parser.add_argument("--canary", action="store_true",
+                        help="also run a quadratic cluster count, which should fail")
+    args = parser.parse_args()
+
+    checks = {name: CHECKS[name] for name in args.only} if args.only else dict(CHECKS)
+    if args.canary:
+        checks["canary (should fail)"] = check_canary
+
+    ok = True
+    for name, check in checks.items():
+        ok &= run_check(name, check, args)
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,8 @@
 import random
 from enum import Enum, IntEnum
-from mesa import Agent
+from itertools import islice
+
+import numpy as np
 
 
 # constants for human and bot agent behaviours
@@ -18,6 +20,13 @@ class EdgeWeight(Enum):
     INVISIBLE = 0.1
 
 
+# edge weights are stored per directed edge as an int8 code: the weight's index in EDGE_WEIGHTS
+EDGE_WEIGHTS = list(EdgeWeight)
+EDGE_VISIBLE = EDGE_WEIGHTS.index(EdgeWeight.VISIBLE)
+EDGE_DASHED = EDGE_WEIGHTS.index(EdgeWeight.DASHED)
+EDGE_INVISIBLE = EDGE_WEIGHTS.index(EdgeWeight.INVISIBLE)
+
+
 class State(IntEnum):
     PROGRESSIVE = 0
     CONSERVATIVE = 1
@@ -44,6 +53,16 @@ class NEGInteraction(IntEnum):
     DISLIKE = -2
 
 
+class EventKind(IntEnum):
+    """Kinds of events recorded in the model's event log (see src.replay)"""
+    POSITIVE = 0  # source did a positive interaction on target. weight: interaction weight, 0 if no hit
+    NEGATIVE = 1  # source did a negative interaction on target. weight: interaction weight, 0 if no hit
+    CONNECT = 2  # target took on source's state
+    DISCONNECT = 3  # edge from source to target became invisible
+    NEUTRAL = 4  # source became neutral. target is -1
+    BOT_LINK = 5  # bot to bot interaction
+
+
 # define list of all positive/negative interaction weights
 POSInteraction_LIST = list(map(int, POSInteraction))
 NEGInteraction_LIST = list(map(int, NEGInteraction))
@@ -59,9 +78,67 @@ def choose_neg_interaction():
     return random.choice(NEGInteraction_LIST)
 
 
+def commit_interactions(states, hit_cons, hit_prog, targets, leanings, weights, became_neutral, coin):
+    """Apply the interactions of a whole step at once (synchronous update) to per-agent arrays.
+
+    Every interaction with a hit weight is buffered during the step as (target, state of the acting agent,
+    weight). The hits of each target are then summed per leaning and the same rules as the sequential
+    interactions applied to the result:
+     - a target that received positive hits of a leaning ending within HIT_REQ..HIT_REQ + HIT_MID takes on
+       that leaning. If both leanings qualify, the one with the larger total hit this step wins and <coin>
+       (one uniform draw per agent) breaks ties
+     - otherwise a target that received negative hits of a leaning ending within 0..HIT_MID (exclusive) is
+       disconnected from the agents that sent them
+     - connected and disconnected targets have their hits reset
+    Agents in <became_neutral> turn neutral (hits reset) before connections are applied, so an agent that
+    is connected in the same step ends up with the connecting leaning.
+
+    states, hit_cons and hit_prog are updated in place. Returns boolean arrays over the interactions:
+    whether each one connected its target (edge becomes visible) and whether it disconnected it (edge
+    becomes invisible).
+    """
+    n = len(states)
+    cons = leanings == State.CONSERVATIVE
+    prog = leanings == State.PROGRESSIVE
+    pos = weights > 0
+    neg = weights < 0
+
+    delta_cons = np.bincount(targets[cons], weights[cons], minlength=n).astype(hit_cons.dtype)
+    delta_prog = np.bincount(targets[prog], weights[prog], minlength=n).astype(hit_prog.dtype)
+    new_cons = hit_cons + delta_cons
+    new_prog = hit_prog + delta_prog
+
+    connect_cons = (np.bincount(targets[pos & cons], minlength=n) > 0) & \
+        (HIT_REQ <= new_cons) & (new_cons <= HIT_REQ + HIT_MID)
+    connect_prog = (np.bincount(targets[pos & prog], minlength=n) > 0) & \
+        (HIT_REQ <= new_prog) & (new_prog <= HIT_REQ + HIT_MID)
+    prog_wins = (delta_prog > delta_cons) | ((delta_prog == delta_cons) & (coin < 0.5))
+    connect_cons &= ~(connect_prog & prog_wins)
+    connect_prog &= ~connect_cons
+    connected = connect_cons | connect_prog
+
+    disconnect_cons = (np.bincount(targets[neg & cons], minlength=n) > 0) & (0 < new_cons) & (new_cons < HIT_MID)
+    disconnect_prog = (np.bincount(targets[neg & prog], minlength=n) > 0) & (0 < new_prog) & (new_prog < HIT_MID)
+    disconnect_cons &= ~connected
+    disconnect_prog &= ~connected
+
+    hit_cons[:] = new_cons
+    hit_prog[:] = new_prog
+    states[became_neutral] = State.NEUTRAL
+    states[connect_cons] = State.CONSERVATIVE
+    states[connect_prog] = State.PROGRESSIVE
+    reset = became_neutral | connected | disconnect_cons | disconnect_prog
+    hit_cons[reset] = 0
+    hit_prog[reset] = 0
+
+    connects = pos & ((cons & connect_cons[targets]) | (prog & connect_prog[targets]))
+    disconnects = neg & ((cons & disconnect_cons[targets]) | (prog & disconnect_prog[targets]))
+    return connects, disconnects
+
+
 def increase_reach(agent, amt):
     # Increase agent's reach
-    if agent.reach < agent.MAX_REACH:
+    if agent.reach < agent.model.max_reach:
         agent.reach += amt
 
 
@@ -70,106 +147,208 @@ def decrease_reach(agent):
         agent.reach -= 1
 
 
-class TikTokAgent(Agent):
-    """Individual TikTokEchoChamber Agent definition and its properties/interaction methods."""
+# enum members by value, to turn the model's int8 codes back into members (so `is` comparisons keep working)
+_STATES = tuple(State)
+_AGENT_TYPES = tuple(AgentType)
+_HUMAN = int(AgentType.HUMAN)
+_BOT = int(AgentType.BOT)
+
+
+class TikTokAgent:
+    """Individual TikTokEchoChamber Agent definition and its properties/interaction methods.
+
+    Agents are flyweight views: an agent only holds its model and its node (pos). Its state, type, hits and
+    reach live in the model's per-node arrays (agent_state, agent_type, agent_hit_cons, agent_hit_prog,
+    agent_reach), like edge weights live in model.edge_weight, and are read and written through properties.
+    Parameters that are identical for every agent (max reach, positive and become-neutral chances) are read
+    from the model. The model creates the views and steps them itself, so agents are not mesa Agents and are
+    not registered in model.agents.
+    """
+
+    __slots__ = ("model", "pos")
 
     def __init__(
             self,
-            id_,
             model,
-            agent_type,
-            initial_state,
-            max_reach,
-            positive_chance,
-            become_neutral_chance,
+            node,
     ):
         """
-        Create a new TikTok agent.
+        Create a view of the agent at <node>. Its state is initialized by the model.
 
         Args:
-        :param id_: Agent's unique Identification number
-        :param agent_type: Human or Bot agent
-        :param initial_state: Whether an agent is Progressive, Conservative or Neutral initially
-        :param max_reach: The max number of interactions that agents can do per step
-        :param positive_chance: Probability of an agent to have positive interactions with others (0-1)
-        :param become_neutral_chance: Probability of a node that has recovered to become resistant (0-1)
+        :param model: The TikTokEchoChamber model holding the agent arrays and the shared agent parameters
+        :param node: The agent's node in the network, and its index in the model's agent arrays
         """
-        super().__init__(model)
-        self.id_ = id_
-        self.state = initial_state
-        self.type = agent_type
-        self.MAX_REACH = max_reach
-        self.positive_chance = positive_chance
-        self.become_neutral_chance = become_neutral_chance
-
-        # keep track of cumulative interaction weights from each state
-        self.hit_cons = 0
-        self.hit_prog = 0
-
-        # set base number of interactions per step (for bots)
-        self.reach = BASE_REACH_BOT if agent_type is AgentType.BOT else BASE_REACH_HUMAN
+        self.model = model
+        self.pos = node
+
+    @property
+    def unique_id(self):
+        # mesa numbers agents from 1 in creation order, and agents are created in node order
+        return self.pos + 1
+
+    @property
+    def id_(self):
+        # the agent's node in the network
+        return self.pos
+
+    @property
+    def random(self):
+        return self.model.random
+
+    @property
+    def state(self):
+        return _STATES[self.model.agent_state[self.pos]]
+
+    @property
+    def type(self):
+        return _AGENT_TYPES[self.model.agent_type[self.pos]]
+
+    @type.setter
+    def type(self, agent_type):
+        self.model.agent_type[self.pos] = agent_type
+
+    @property
+    def hit_cons(self):
+        return self.model.agent_hit_cons.item(self.pos)
+
+    @hit_cons.setter
+    def hit_cons(self, value):
+        self.model.agent_hit_cons[self.pos] = value
+
+    @property
+    def hit_prog(self):
+        return self.model.agent_hit_prog.item(self.pos)
+
+    @hit_prog.setter
+    def hit_prog(self, value):
+        self.model.agent_hit_prog[self.pos] = value
+
+    @property
+    def reach(self):
+        return self.model.agent_reach.item(self.pos)
+
+    @reach.setter
+    def reach(self, value):
+        self.model.agent_reach[self.pos] = value
+
+    @property
+    def MAX_REACH(self):
+        return self.model.max_reach
+
+    @property
+    def positive_chance(self):
+        return self.model.positive_chance
+
+    @property
+    def become_neutral_chance(self):
+        return self.model.become_neutral_chance
+
+    def set_state(self, state):
+        # every state change goes through here so the model's state counters stay up to date
+        model = self.model
+        counts = model.state_counts
+        counts[model.agent_state[self.pos]] -= 1
+        counts[state] += 1
+        model.agent_state[self.pos] = state
+        if model.touched_agents is not None:
+            model.touched_agents.append(self)
 
     def try_gain_neutrality(self):
-        if self.random.random() < self.become_neutral_chance:
-            self.state = State.NEUTRAL
+        """Become neutral with the model's become_neutral_chance. Returns whether the agent turned neutral
+        (in two-phase update mode it only does so when the step is committed)."""
+        if self.random.random() < self.model.become_neutral_chance:
+            if self.model.pending_neutral is not None:
+                self.model.pending_neutral.append(self)
+                return True
+            if self.model.event_log is not None:
+                self.model.event_log.record(self.pos, -1, EventKind.NEUTRAL, 0, self.state)
+            self.set_state(State.NEUTRAL)
             self.hit_prog = 0
             self.hit_cons = 0
+            return True
+        return False
 
     def get_neighbours(self):
-        neighbors_nodes = self.model.grid.get_neighborhood(
-            self.pos, include_center=False
-        )  # get all nearby agents, self not included
-        return neighbors_nodes
+        # get all nearby nodes, self not included
+        return self.model.topology.neighbors(self.pos).tolist()
+
+    def neighbour_edges(self):
+        """(edge id, agent) for every neighbour, where edge id is the id of the edge from self to the neighbour.
+        Neighbours come in increasing node order (the topology's CSR order), which decides who the first
+        <reach> neighbours of an interaction are."""
+        topology = self.model.topology
+        lo = int(topology.indptr[self.pos])
+        nodes = topology.indices[lo:topology.indptr[self.pos + 1]].tolist()
+        return zip(range(lo, lo + len(nodes)), map(self.model.agent_at.__getitem__, nodes))
+
+    def _neighbour_edges_where(self, same_state, agent_type):
+        """(edge id, agent) for the neighbours in the same (or a different) state as self and of <agent_type>."""
+        model = self.model
+        topology = model.topology
+        pos = self.pos
+        lo = int(topology.indptr[pos])
+        nodes = topology.indices[lo:topology.indptr[pos + 1]].tolist()
+        # neighbourhoods are small, so reading the arrays element-wise beats vectorizing over them
+        state_of = model.agent_state.item
+        type_of = model.agent_type.item
+        state = state_of(pos)
+        agent_at = model.agent_at
+        if same_state:
+            return [(lo + i, agent_at[node]) for i, node in enumerate(nodes)
+                    if state_of(node) == state and type_of(node) == agent_type]
+        return [(lo + i, agent_at[node]) for i, node in enumerate(nodes)
+                if state_of(node) != state and type_of(node) == agent_type]
 
     def get_dissimilar_human_neighbours(self):
-        neighbors_nodes = self.get_neighbours()
-
-        dissimilar_neighbors = [
-            agent
-            for agent in self.model.grid.get_cell_list_contents(neighbors_nodes)
-            if (agent.state is not self.state) and (agent.type is AgentType.HUMAN)
-        ]
-        return dissimilar_neighbors
+        return self._neighbour_edges_where(False, _HUMAN)
+
+    def iter_dissimilar_human_neighbours(self):
+        """Lazy get_dissimilar_human_neighbours, checking the agent's neighbours only as far as the caller reads,
+        for callers that only need the first few (like a hub bot that can only reach <reach> of them)."""
+        model = self.model
+        topology = model.topology
+        pos = self.pos
+        lo = int(topology.indptr[pos])
+        nodes = topology.indices[lo:topology.indptr[pos + 1]]
+        state_of = model.agent_state.item
+        type_of = model.agent_type.item
+        state = state_of(pos)
+        agent_at = model.agent_at
+        for i, node in enumerate(nodes.tolist()):
+            if state_of(node) != state and type_of(node) == _HUMAN:
+                yield lo + i, agent_at[node]
 
     def get_similar_neighbours(self):
-        neighbors_nodes = self.get_neighbours()
-        similar_neighbors = [
-            agent
-            for agent in self.model.grid.get_cell_list_contents(neighbors_nodes)
-        ]
-        return similar_neighbors
+        return list(self.neighbour_edges())
 
     def get_similar_human_neighbours(self):
-        neighbors_nodes = self.get_neighbours()
-        similar_neighbors = [
-            agent
-            for agent in self.model.grid.get_cell_list_contents(neighbors_nodes)
-            if (agent.state is self.state) and (agent.type is AgentType.HUMAN)
-        ]
-        return similar_neighbors
+        return self._neighbour_edges_where(True, _HUMAN)
 
     def get_similar_bot_neighbours(self):
-        neighbors_nodes = self.get_neighbours()
-        similar_bot_neighbors = [
-            agent
-            for agent in self.model.grid.get_cell_list_contents(neighbors_nodes)
-            if (agent.state is self.state) and (agent.type is AgentType.BOT)
-        ]
-        return similar_bot_neighbors
-
-    def connect(self, agent):
-        agent.state = self.state
+        return self._neighbour_edges_where(True, _BOT)
+
+    def connect(self, agent, edge):
+        if self.model.event_log is not None:
+            self.model.event_log.record(self.pos, agent.pos, EventKind.CONNECT, 0, self.state)
+        agent.set_state(self.state)
         agent.hit_cons = 0
         agent.hit_prog = 0
 
-        self.model.G[self.id_][agent.id_]['weight'] = EdgeWeight.VISIBLE
+        self.model.edge_weight[edge] = EDGE_VISIBLE
+        if self.model.touched_edges is not None:
+            self.model.touched_edges.append(edge)
         # print(f"{self.id_} and {agent.id_} connected")
 
-    def disconnect(self, agent):
+    def disconnect(self, agent, edge):
+        if self.model.event_log is not None:
+            self.model.event_log.record(self.pos, agent.pos, EventKind.DISCONNECT, 0, self.state)
         agent.hit_cons = 0
         agent.hit_prog = 0
 
-        self.model.G[self.id_][agent.id_]['weight'] = EdgeWeight.INVISIBLE  # remove edges with neighbor
+        self.model.edge_weight[edge] = EDGE_INVISIBLE  # remove edges with neighbor
+        if self.model.touched_edges is not None:
+            self.model.touched_edges.append(edge)
         # print(f"{self.id_} and {agent.id_} disconnected")
 
     def do_positive(self, cap):
@@ -181,69 +360,171 @@ class TikTokAgent(Agent):
              self state can be passed on to the receiving agent
         """
         dissimilar_neighbors = self.get_dissimilar_human_neighbours()
+        model = self.model
+        edge_weight = model.edge_weight
+        hit_cons = model.agent_hit_cons
+        hit_prog = model.agent_hit_prog
+        positive_chance = model.positive_chance
+        rand = self.random.random
+        log = model.event_log
+        pending = model.pending_hits
+        touched = model.touched_edges
+        state = self.state  # only changes when self does a negative interaction
 
         counter = 0
-        for agent in dissimilar_neighbors:
-            if self.random.random() < self.positive_chance and counter < cap:
-                self.model.G[self.id_][agent.id_]['weight'] = EdgeWeight.DASHED
+        for edge, agent in dissimilar_neighbors:
+            if rand() < positive_chance and counter < cap:
+                edge_weight[edge] = EDGE_DASHED
+                if touched is not None:
+                    touched.append(edge)
 
                 # choose what positive interaction to do to neighbor agent
                 #   then try to pass on self state to agent if hit satisfied
-                if self.state == State.CONSERVATIVE and agent.hit_cons < HIT_REQ + HIT_MID:
-                    agent.hit_cons += choose_pos_interaction()
-                    if HIT_REQ <= agent.hit_cons <= HIT_REQ + HIT_MID:
-                        self.connect(agent)
-                elif self.state == State.PROGRESSIVE and agent.hit_cons < HIT_REQ + HIT_MID:
-                    agent.hit_prog += choose_pos_interaction()
-                    if HIT_REQ <= agent.hit_prog <= HIT_REQ + HIT_MID:
-                        self.connect(agent)
+                node = agent.pos
+                weight = 0
+                if state is not State.NEUTRAL and hit_cons.item(node) < HIT_REQ + HIT_MID:
+                    weight = choose_pos_interaction()
+                if log is not None:
+                    log.record(self.pos, node, EventKind.POSITIVE, weight, state)
+                if weight and pending is not None:
+                    pending.append((agent, edge, state, weight))
+                elif weight:
+                    hits = hit_cons if state == State.CONSERVATIVE else hit_prog
+                    hit = hits.item(node) + weight
+                    hits[node] = hit
+                    if HIT_REQ <= hit <= HIT_REQ + HIT_MID:
+                        self.connect(agent, edge)
 
                 increase_reach(self, 1)  # increase initiating agent's reach
                 # self.model.interactions += f"+Agent {self.id_} followed {agent.id_}<br>"
             counter += 1  # keep track of number of interactions so far
 
+    def do_bot_positive(self, cap):
+        """Batched do_positive for bots.
+
+            Bots are the hubs of the network, so instead of collecting every dissimilar neighbour, only the
+             first <cap> dissimilar human neighbours are taken (the only ones do_positive can interact with).
+             The positive_chance tests and interaction weights for all of them come from a single draw on
+             the model's numpy generator, and the bot's reach is updated once at the end.
+        """
+        targets = list(islice(self.iter_dissimilar_human_neighbours(), cap))
+        k = len(targets)
+        if k == 0:
+            return
+
+        # first k draws decide whether each interaction happens, the next k pick its weight
+        model = self.model
+        draws = model.rng.random(2 * k).tolist()
+        positive_chance = model.positive_chance
+        num_weights = len(POSInteraction_LIST)
+        state = self.state
+        hit_cons = model.agent_hit_cons
+        hits = hit_cons if state == State.CONSERVATIVE else model.agent_hit_prog
+        edge_weight = model.edge_weight
+        log = model.event_log
+        pending = model.pending_hits
+        touched = model.touched_edges
+
+        n = 0
+        for (edge, agent), accept, pick in zip(targets, draws[:k], draws[k:]):
+            if accept >= positive_chance:
+                continue
+            n += 1
+            edge_weight[edge] = EDGE_DASHED
+            if touched is not None:
+                touched.append(edge)
+
+            # same hit bookkeeping as do_positive: the hit_cons gate applies to both leanings
+            node = agent.pos
+            weight = 0
+            if hit_cons.item(node) < HIT_REQ + HIT_MID:
+                weight = POSInteraction_LIST[int(pick * num_weights)]
+            if log is not None:
+                log.record(self.pos, node, EventKind.POSITIVE, weight, state)
+            if weight and pending is not None:
+                pending.append((agent, edge, state, weight))
+            elif weight:
+                hit = hits.item(node) + weight
+                hits[node] = hit
+                if HIT_REQ <= hit <= HIT_REQ + HIT_MID:
+                    self.connect(agent, edge)
+
+        # equivalent to calling increase_reach(self, 1) once per interaction
+        reach = self.reach
+        if n and reach < model.max_reach:
+            self.reach = min(reach + n, model.max_reach)
+
     def do_negative(self, cap):
         """Have a negative interaction with another human or bot agent"""
         # Try to reduce relevant self hit based on neighboring nodes. Limited to <cap> number of neighbors.
         similar_neighbors = self.get_similar_neighbours()
+        model = self.model
+        edge_weight = model.edge_weight
+        hit_cons = model.agent_hit_cons
+        hit_prog = model.agent_hit_prog
+        log = model.event_log
+        pending = model.pending_hits
+        touched = model.touched_edges
+        leaning = self.state  # neutral from the interaction the agent turns neutral on
 
         counter = 0
-        for agent in similar_neighbors:
+        for edge, agent in similar_neighbors:
             if counter < cap:
-                self.model.G[self.id_][agent.id_]['weight'] = EdgeWeight.DASHED
+                edge_weight[edge] = EDGE_DASHED
+                if touched is not None:
+                    touched.append(edge)
 
                 # choose what negative interaction to do to neighbor agent
                 #   then try to become neutral
-                if self.state == State.CONSERVATIVE and agent.hit_cons > 0:
-                    agent.hit_cons += choose_neg_interaction()
-                    if 0 < agent.hit_cons < HIT_MID:
-                        self.disconnect(agent)
-                elif self.state == State.PROGRESSIVE and agent.hit_cons > 0:
-                    agent.hit_prog += choose_neg_interaction()
-                    if 0 < agent.hit_prog < HIT_MID:
-                        self.disconnect(agent)
-                self.try_gain_neutrality()
+                node = agent.pos
+                weight = 0
+                if leaning is not State.NEUTRAL and hit_cons.item(node) > 0:
+                    weight = choose_neg_interaction()
+                if log is not None:
+                    log.record(self.pos, node, EventKind.NEGATIVE, weight, leaning)
+                if weight and pending is not None:
+                    pending.append((agent, edge, leaning, weight))
+                elif weight:
+                    hits = hit_cons if leaning == State.CONSERVATIVE else hit_prog
+                    hit = hits.item(node) + weight
+                    hits[node] = hit
+                    if 0 < hit < HIT_MID:
+                        self.disconnect(agent, edge)
+                if self.try_gain_neutrality():
+                    leaning = State.NEUTRAL
                 decrease_reach(self)  # reduce self reach
                 # self.model.interactions += f"-Agent {self.id_} UNfollowed {agent.id_}<br>"
                 counter += 1
 
     def do_bot_to_bot_interaction(self):
         """Do positive interactions with neighboring bots"""
+        state = self.state
         similar_bot_neighbors = self.get_similar_bot_neighbours()
+        model = self.model
+        edge_weight = model.edge_weight
+        touched = model.touched_edges
 
         cap = 0
-        for agent in similar_bot_neighbors:
-            if cap < self.reach:
-                # Increase reach for initiating bot (up to max of 8)
-                increase_reach(self, 3)
-
-                # Update edge weight for visualization
-                self.model.G[self.id_][agent.id_]['weight'] = EdgeWeight.VISIBLE
+        reach = self.reach
+        for edge, agent in similar_bot_neighbors:
+            if cap >= reach:
+                break  # reach only grows inside the loop, so no later neighbour can be reached
+            # Increase reach for initiating bot (up to max of 8)
+            if reach < model.max_reach:
+                reach += 3
+
+            # Update edge weight for visualization
+            edge_weight[edge] = EDGE_VISIBLE
+            if touched is not None:
+                touched.append(edge)
+            if model.event_log is not None:
+                model.event_log.record(self.pos, agent.pos, EventKind.BOT_LINK, 0, state)
             cap += 1
+        self.reach = reach
 
     def do_bot(self):
         # Bot-to-human interactions strategy
-        self.do_positive(self.reach)
+        self.do_bot_positive(self.reach)
 
         # Bot-to-bot interactions strategy
         self.do_bot_to_bot_interaction()
@@ -261,5 +542,5 @@ class TikTokAgent(Agent):
         """Node does pos/neg interactions based on type"""
         if self.type is AgentType.HUMAN:
             self.do_human()
-        if self.type is AgentType.BOT:
+        else:
             self.do_bot()
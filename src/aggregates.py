@@ -0,0 +1,156 @@
+"""Per parameter combination aggregates of batch runs, for comparing sweeps.
+
+batch_run returns one row per run and step (and per agent when there are agent reporters), which is
+slow to slice by hand over thousands of runs. build_aggregates() reduces those rows once to the mean and
+quantiles of every metric's trajectory for each parameter combination ("cell"), kept as dense arrays
+indexed by cell, metric and step, so looking up or overlaying trajectories is just array indexing::
+
+    results = batch_run(TikTokEchoChamber, parameters, iterations=50, ...)
+    aggregates = build_aggregates(results, parameters)
+    aggregates.save("sweep.npz")
+
+    aggregates = Aggregates.load("sweep.npz")
+    cell = aggregates.cell({"positive_chance": 0.8, "become_neutral_chance": 0.2})
+    aggregates.trajectory(cell, "Neutral")
+
+Runs that stop before the longest run of the batch keep their final values for the remaining steps.
+"""
+
+import json
+
+import numpy as np
+
+DEFAULT_METRICS = (
+    "Conservative",
+    "Progressive",
+    "Neutral",
+    "CA_Num_Clusters",
+    "CA_Num_Cons_Clusters",
+    "CA_Num_Prog_Clusters",
+    "CA_Avg_Cluster_Size",
+    "CA_Cross_Interactions",
+    "CA_Cons_Avg_Cluster_Size",
+    "CA_Prog_Avg_Cluster_Size",
+    "Reach_Mean",
+    "Reach_Median",
+)
+DEFAULT_QUANTILES = (0.1, 0.5, 0.9)
+
+
+class Aggregates:
+    """Mean and quantile trajectories of metrics for every cell of a parameter sweep."""
+
+    def __init__(self, params, cells, metrics, steps, mean, quantiles, quantile_values, runs):
+        self.params = list(params)  # names of the parameters that define a cell
+        self.cells = [tuple(cell) for cell in cells]  # parameter values of each cell, in params order
+        self.metrics = list(metrics)
+        self.steps = np.asarray(steps)
+        self.mean = mean  # (cells, metrics, steps)
+        self.quantiles = np.asarray(quantiles)
+        self.quantile_values = quantile_values  # (quantiles, cells, metrics, steps)
+        self.runs = np.asarray(runs)  # number of runs in each cell
+        self._cell_index = {cell: i for i, cell in enumerate(self.cells)}
+        self._metric_index = {metric: i for i, metric in enumerate(self.metrics)}
+
+    def values(self, param):
+        """Sorted distinct values of <param> over all cells."""
+        i = self.params.index(param)
+        return sorted({cell[i] for cell in self.cells})
+
+    def cell(self, params):
+        """Index of the cell with the given {param: value}."""
+        return self._cell_index[tuple(params[p] for p in self.params)]
+
+    def label(self, cell):
+        return ", ".join(f"{p}={v}" for p, v in zip(self.params, self.cells[cell]))
+
+    def trajectory(self, cell, metric):
+        """Steps, mean and {quantile: values} of <metric> over the runs of <cell>."""
+        m = self._metric_index[metric]
+        return self.steps, self.mean[cell, m], {q: self.quantile_values[i, cell, m] for i, q in enumerate(self.quantiles)}
+
+    def save(self, path):
+        np.savez_compressed(
+            path,
+            params=json.dumps(self.params),
+            cells=json.dumps(self.cells, default=lambda value: value.item()),  # numpy scalars
+            metrics=json.dumps(self.metrics),
+            steps=self.steps,
+            mean=self.mean,
+            quantiles=self.quantiles,
+            quantile_values=self.quantile_values,
+            runs=self.runs,
+        )
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        return cls(
+            json.loads(str(data["params"])),
+            json.loads(str(data["cells"])),
+            json.loads(str(data["metrics"])),
+            data["steps"],
+            data["mean"],
+            data["quantiles"],
+            data["quantile_values"],
+            data["runs"],
+        )
+
+
+def build_aggregates(results, params, metrics=DEFAULT_METRICS, quantiles=DEFAULT_QUANTILES):
+    """
+    Reduce batch_run results to per cell trajectories.
+
+    Args:
+    :param results: Rows returned by batch_run (a list of dicts or a pandas DataFrame), or its compact output
+    :param params: Names of the parameters that define a cell, e.g. the parameters dict passed to batch_run
+    :param metrics: Columns to aggregate. Metrics missing from the results are skipped
+    :param quantiles: Quantiles of each metric to keep besides the mean
+    """
+    params = list(params)
+    run_data = {}
+    if isinstance(results, dict):
+        # compact output: parameters are in the run rows
+        run_data = {run["RunId"]: run for run in results["runs"]}
+        results = results["steps"]
+    if hasattr(results, "to_dict"):
+        results = results.to_dict("records")
+    if not len(results):
+        raise ValueError("no results to aggregate")
+    metrics = [m for m in metrics if m in results[0]]
+
+    # one row per run and step; rows of other agents at the same step repeat the model values
+    runs = {}
+    for row in results:
+        if row["RunId"] not in runs:
+            run = run_data.get(row["RunId"], row)
+            runs[row["RunId"]] = ({}, tuple(run[p] for p in params))
+        values = runs[row["RunId"]][0]
+        if row["Step"] not in values:
+            values[row["Step"]] = [row[m] for m in metrics]
+
+    steps = np.array(sorted({step for values, _ in runs.values() for step in values}))
+    data = np.full((len(runs), len(metrics), len(steps)), np.nan)
+    cell_of_run = []
+    cells = {}
+    for r, (values, cell) in enumerate(runs.values()):
+        run_steps = np.searchsorted(steps, list(values))
+        data[r][:, run_steps] = np.array(list(values.values()), dtype=float).T
+        cell_of_run.append(cells.setdefault(cell, len(cells)))
+
+    # carry every run's last recorded values forward over steps it has no row for
+    recorded = ~np.isnan(data)
+    last = np.where(recorded, np.arange(len(steps)), 0)
+    np.maximum.accumulate(last, axis=2, out=last)
+    data = np.take_along_axis(data, last, axis=2)
+
+    cell_of_run = np.array(cell_of_run)
+    mean = np.empty((len(cells), len(metrics), len(steps)))
+    quantile_values = np.empty((len(quantiles), len(cells), len(metrics), len(steps)))
+    for c in range(len(cells)):
+        cell_data = data[cell_of_run == c]
+        mean[c] = np.nanmean(cell_data, axis=0)
+        quantile_values[:, c] = np.nanquantile(cell_data, quantiles, axis=0)
+
+    return Aggregates(params, list(cells), metrics, steps, mean, quantiles, quantile_values,
+                      np.bincount(cell_of_run, minlength=len(cells)))
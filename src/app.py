@@ -1,4 +1,6 @@
-from matplotlib.figure import Figure
+import threading
+import time
+
 import solara
 import networkx as nx
 
@@ -7,13 +9,63 @@ from src.model import (
     State,
     TikTokEchoChamber,
     number_conservative, number_progressive, number_neutral, cons_progressive_ratio, step_interactions,
-    identify_clusters
 )
 from mesa.visualization import (
     Slider,
     SolaraViz,
     make_plot_component
 )
+from mesa.visualization.utils import force_update, update_counter
+
+# steps AutoPlay advances the model between renders, tuned by AutoPlay. Separate from SolaraViz's "Render Interval",
+#   which stays what mesa's Step and ▶ buttons advance per click
+autoplay_interval = solara.reactive(1)
+MAX_RENDER_INTERVAL = 100
+
+
+class AppModel(TikTokEchoChamber):
+    """TikTokEchoChamber whose steps are serialized, since AutoPlay steps it on a worker thread while mesa's Step
+    and ▶ buttons step it from the event loop. A step of a model that stopped running does nothing, so a button
+    that was not disabled yet (mesa only learns the model stopped on its own next step) cannot push it further."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._step_lock = threading.Lock()
+        # wrap mesa's step wrapper, so the step counter it increments is covered by the lock too
+        self._unlocked_step = self.step
+        self.step = self._locked_step
+
+    def _locked_step(self):
+        with self._step_lock:
+            if self.running:
+                self._unlocked_step()
+
+
+def rerender_on(signature):
+    """Make a component of the model render again only when signature(model) changed, instead of on every update."""
+    def wrap(component):
+        @solara.component
+        def Inner(model, signature):
+            # rendered again only when its arguments change
+            return component(model)
+
+        @solara.component
+        def Memoized(model):
+            update_counter.get()
+            return Inner(model, signature(model))
+
+        return Memoized
+
+    return wrap
+
+
+def network_signature(model):
+    return model.edge_weight.tobytes(), model.agent_state.tobytes()
+
+
+def stats_signature(model):
+    stats = model.cluster_stats
+    return tuple(model.state_counts), stats.labels.tobytes(), tuple(stats[1:])
 
 
 def get_agent_stats(model):
@@ -41,13 +93,13 @@ def get_agent_stats(model):
 
 
 def get_cluster_stats(model):
-    # Get and display cluster stats from model
+    # Get and display cluster stats the model identified for the current step
     clusters, number_cluster, avg_cluster_size, cluster_ratio, cross_interactions, \
-        cons_clstr_avg_size, prog_clstr_avg_size, cons_count, prog_count = identify_clusters(model)
+        cons_clstr_avg_size, prog_clstr_avg_size, cons_count, prog_count = model.cluster_stats
 
     # Transform clusters list into dictionary format
     cluster_dict = {}
-    for node_idx, cluster_id in enumerate(clusters):
+    for node_idx, cluster_id in enumerate(clusters.tolist()):
         if cluster_id not in cluster_dict:
             cluster_dict[cluster_id] = []
         cluster_dict[cluster_id].append(node_idx)
@@ -80,6 +132,71 @@ def get_cluster_stats(model):
     return solara.Markdown(markdown_text)
 
 
+@rerender_on(lambda model: len(model.cluster_history))
+def ClusterHistory(model):
+    # scrub through the cluster assignments of past steps, read back from the model's cluster store
+    history = model.cluster_history
+    step, set_step = solara.use_state(len(history) - 1)
+    step = min(step, len(history) - 1)
+
+    cluster_dict = {}
+    for node_idx, cluster_id in enumerate(history[step].tolist()):
+        cluster_dict.setdefault(cluster_id, []).append(node_idx)
+    cluster_display = "<br />".join(f"{cluster_id}: {node_list}" for cluster_id, node_list in sorted(cluster_dict.items()))
+
+    return solara.Column(children=[
+        solara.SliderInt(label="Step", value=step, min=0, max=len(history) - 1, on_value=set_step),
+        solara.Markdown(f"""
+    ### Cluster Assignments at Step {step}
+
+    - Number of Clusters: {len(cluster_dict)}
+
+    {cluster_display}
+    """),
+    ])
+
+
+@solara.component
+def AutoPlay(model):
+    """Play the model on a worker thread, advancing autoplay_interval steps between renders. Every step still
+    collects its data, only drawing is skipped. With auto tuning on, autoplay_interval follows the measured cost
+    of a step and of a render so that drawing takes no longer than stepping."""
+    playing = solara.use_reactive(False)
+    auto = solara.use_reactive(True)
+
+    def play():
+        step_time = render_time = None
+        while playing.value and model.running:
+            t_start = time.perf_counter()
+            steps = 0
+            while steps < autoplay_interval.value and model.running:
+                model.step()
+                steps += 1
+            t_stepped = time.perf_counter()
+            force_update()  # the components render here, on this thread
+            t_rendered = time.perf_counter()
+
+            if auto.value:
+                step_time = _smooth(step_time, (t_stepped - t_start) / steps)
+                render_time = _smooth(render_time, t_rendered - t_stepped)
+                autoplay_interval.value = min(max(1, round(render_time / step_time)), MAX_RENDER_INTERVAL)
+        playing.value = False
+
+    solara.lab.use_task(play, dependencies=[playing.value, model], prefer_threaded=True)
+
+    return solara.Row(children=[
+        solara.Button(label="Auto play" if not playing.value else "❚❚", color="primary",
+                      on_click=lambda: playing.set(not playing.value), disabled=not model.running),
+        solara.Checkbox(label="Tune steps per render", value=auto),
+        solara.Text(f"{autoplay_interval.value} steps per render"),
+    ])
+
+
+def _smooth(average, value, weight=0.3):
+    # exponential moving average of the measured costs, so one slow frame does not swing the interval
+    return value if average is None else (1 - weight) * average + weight * value
+
+
 def get_interactions(model):
     text = step_interactions(model)
     markdown_text = f"""
@@ -147,7 +264,11 @@ def post_process_lineplot(ax):
     ax.legend(bbox_to_anchor=(1.05, 1.0), loc="upper left")
 
 
+@rerender_on(network_signature)
 def SpacePlot(model):
+    # matplotlib is only loaded once the network is first drawn
+    from matplotlib.figure import Figure
+
     fig = Figure()
     ax = fig.add_subplot()
 
@@ -157,8 +278,9 @@ def SpacePlot(model):
     all_nodes = []
     bot_colors = []
     hum_colors = []
-    for agent in model.grid.agents:
-        node = agent.id_
+    G = model.to_networkx()
+    for agent in model.agent_at:
+        node = agent.pos
         all_nodes.append(node)
         if agent.type == AgentType.BOT:
             bot_nodes.append(node)
@@ -179,13 +301,13 @@ def SpacePlot(model):
     edge_alphas = []
     edge_styles = []
     edge_colors = []
-    for u, v in model.G.edges():
-        edge_alphas.append(0 if model.G[u][v].get('weight') == EdgeWeight.INVISIBLE else 0.5)
-        edge_styles.append('dashed' if model.G[u][v].get('weight') == EdgeWeight.DASHED else 'solid')
+    for u, v in G.edges():
+        edge_alphas.append(0 if G[u][v].get('weight') == EdgeWeight.INVISIBLE else 0.5)
+        edge_styles.append('dashed' if G[u][v].get('weight') == EdgeWeight.DASHED else 'solid')
 
         # Set edge color based on source node's state if it's a bot
-        agent_u = model.grid.get_cell_list_contents([u])[0]
-        agent_v = model.grid.get_cell_list_contents([v])[0]
+        agent_u = model.agent_at[u]
+        agent_v = model.agent_at[v]
 
         if agent_u.type == agent_v.type == AgentType.BOT:
             if agent_u.state == agent_v.state == State.PROGRESSIVE:
@@ -201,11 +323,11 @@ def SpacePlot(model):
     allpos = botpos | humpos
 
     # Draw the networks
-    nx.draw_networkx_nodes(model.G, humpos, nodelist=hum_nodes, node_color=hum_colors, node_shape="o", node_size=100, ax=ax, label="Human")
-    nx.draw_networkx_nodes(model.G, botpos, nodelist=bot_nodes, node_color=bot_colors, node_shape="x", node_size=100, ax=ax, label="Bot")
-    nx.draw_networkx_edges(model.G, model.pos, edge_color=edge_colors, width=1, alpha=edge_alphas, style=edge_styles, ax=ax)
+    nx.draw_networkx_nodes(G, humpos, nodelist=hum_nodes, node_color=hum_colors, node_shape="o", node_size=100, ax=ax, label="Human")
+    nx.draw_networkx_nodes(G, botpos, nodelist=bot_nodes, node_color=bot_colors, node_shape="x", node_size=100, ax=ax, label="Bot")
+    nx.draw_networkx_edges(G, model.pos, edge_color=edge_colors, width=1, alpha=edge_alphas, style=edge_styles, ax=ax)
     label_options = {"fc": "white", "alpha": 0.6, "boxstyle": "circle", "linestyle": ""}
-    nx.draw_networkx_labels(model.G, allpos, font_size=8, bbox=label_options, ax=ax)
+    nx.draw_networkx_labels(G, allpos, font_size=8, bbox=label_options, ax=ax)
 
     ax.legend(loc="best")
     ax.set_axis_off()
@@ -213,6 +335,7 @@ def SpacePlot(model):
     return solara.FigureMatplotlib(fig)
 
 
+@rerender_on(stats_signature)
 def StatsRow(model):
     return solara.Row(children=[
         solara.Column(children=[get_agent_stats(model)], style={"width": "30%"}),
@@ -225,15 +348,17 @@ StatePlot = make_plot_component(
     post_process=post_process_lineplot,
 )
 
-model1 = TikTokEchoChamber()
+model1 = AppModel()
 
 
 page = SolaraViz(
     model1,
     components=[
+        AutoPlay,
         SpacePlot,
         StatePlot,
-        StatsRow
+        StatsRow,
+        ClusterHistory,
     ],
     model_params=model_params,
     name="TikTok Echo Chamber Model",
@@ -0,0 +1,82 @@
+"""Compact per-step storage of cluster assignments.
+
+Between consecutive steps only a handful of nodes change cluster, so instead of a full list of
+``num_nodes`` labels per step, ClusterStore keeps a full keyframe every <keyframe_interval> steps and,
+for the steps in between, only the nodes whose label changed since the previous step. Looking up any
+step applies at most keyframe_interval - 1 deltas to the nearest earlier keyframe.
+"""
+
+import numpy as np
+
+
+class ClusterStore:
+    """Cluster label history stored as keyframes plus sparse per-step deltas."""
+
+    def __init__(self, keyframe_interval=50):
+        self.keyframe_interval = keyframe_interval
+        self._keyframes = []  # labels at steps 0, k, 2k, ...
+        self._deltas = []  # (nodes, labels) changed since the previous step, None at keyframe steps
+        self._last = None
+        self.last_changed = 0  # number of nodes whose label changed at the latest append
+
+    def __len__(self):
+        return len(self._deltas)
+
+    def append(self, labels):
+        """Store the cluster labels (one per node) of the next step."""
+        labels = np.asarray(labels, dtype=np.int32)
+        changed = np.flatnonzero(labels != self._last) if self._last is not None else np.arange(len(labels))
+        self.last_changed = len(changed)
+        if len(self._deltas) % self.keyframe_interval == 0:
+            self._keyframes.append(labels.copy())
+            self._deltas.append(None)
+        else:
+            self._deltas.append((changed.astype(np.int32), labels[changed]))
+        self._last = labels.copy()
+
+    def __getitem__(self, step):
+        """Cluster labels at <step> as an int32 array."""
+        if step < 0:
+            step += len(self)
+        if not 0 <= step < len(self):
+            raise IndexError(f"step {step} out of range for {len(self)} stored steps")
+        keyframe = step // self.keyframe_interval
+        labels = self._keyframes[keyframe].copy()
+        for i in range(keyframe * self.keyframe_interval + 1, step + 1):
+            nodes, values = self._deltas[i]
+            labels[nodes] = values
+        return labels
+
+    @property
+    def nbytes(self):
+        """Bytes used by the stored labels."""
+        return sum(k.nbytes for k in self._keyframes) + \
+            sum(d[0].nbytes + d[1].nbytes for d in self._deltas if d is not None)
+
+    def save(self, path):
+        """Save to a .npz file: keyframes stacked, deltas concatenated with per-step offsets."""
+        deltas = [d if d is not None else (np.empty(0, np.int32), np.empty(0, np.int32)) for d in self._deltas]
+        np.savez_compressed(
+            path,
+            keyframe_interval=self.keyframe_interval,
+            keyframes=np.stack(self._keyframes) if self._keyframes else np.empty((0, 0), np.int32),
+            offsets=np.cumsum([0] + [len(n) for n, _ in deltas]),
+            nodes=np.concatenate([n for n, _ in deltas]) if deltas else np.empty(0, np.int32),
+            labels=np.concatenate([v for _, v in deltas]) if deltas else np.empty(0, np.int32),
+        )
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        store = cls(int(data["keyframe_interval"]))
+        keyframes, offsets, nodes, labels = data["keyframes"], data["offsets"], data["nodes"], data["labels"]
+        store._keyframes = list(keyframes)
+        for step in range(len(offsets) - 1):
+            if step % store.keyframe_interval == 0:
+                store._deltas.append(None)
+            else:
+                lo, hi = offsets[step], offsets[step + 1]
+                store._deltas.append((nodes[lo:hi], labels[lo:hi]))
+        if len(store):
+            store._last = store[len(store) - 1]
+        return store
@@ -0,0 +1,60 @@
+"""Dashboard comparing the runs of a parameter sweep, read from precomputed aggregates (see src.aggregates).
+
+    AGGREGATES=sweep.npz solara run compare.py
+
+Pick a value for every swept parameter to show the mean and quantile band of a metric for that cell,
+and add cells to the overlay to compare them.
+"""
+
+import os
+
+import solara
+
+from src.aggregates import Aggregates
+
+AGGREGATES_PATH = os.environ.get("AGGREGATES", "aggregates.npz")
+
+
+def TrajectoryPlot(aggregates, cells, metric):
+    # matplotlib is only loaded once a trajectory is first drawn
+    from matplotlib.figure import Figure
+
+    fig = Figure()
+    ax = fig.add_subplot()
+    low, high = aggregates.quantiles.min(), aggregates.quantiles.max()
+    for cell in cells:
+        steps, mean, quantiles = aggregates.trajectory(cell, metric)
+        line, = ax.plot(steps, mean, label=f"{aggregates.label(cell)} ({aggregates.runs[cell]} runs)")
+        ax.fill_between(steps, quantiles[low], quantiles[high], color=line.get_color(), alpha=0.2)
+    ax.set_xlabel("Step")
+    ax.set_ylabel(metric)
+    ax.set_title(f"{metric}: mean and {low:.0%}-{high:.0%} quantiles")
+    ax.legend(loc="best", fontsize="small")
+    return solara.FigureMatplotlib(fig)
+
+
+@solara.component
+def Page():
+    aggregates = solara.use_memo(lambda: Aggregates.load(AGGREGATES_PATH), [])
+    selection, set_selection = solara.use_state({p: aggregates.values(p)[0] for p in aggregates.params})
+    metric, set_metric = solara.use_state(aggregates.metrics[0])
+    overlay, set_overlay = solara.use_state([])
+
+    def select(param, value):
+        set_selection({**selection, param: value})
+
+    cell = aggregates.cell(selection)
+    cells = overlay + [cell] if cell not in overlay else overlay
+
+    with solara.Sidebar():
+        solara.Select(label="Metric", value=metric, values=aggregates.metrics, on_value=set_metric)
+        for param in aggregates.params:
+            values = aggregates.values(param)
+            if len(values) > 1:
+                solara.Select(label=param, value=selection[param], values=values,
+                              on_value=lambda value, param=param: select(param, value))
+        solara.Button("Add to overlay", on_click=lambda: set_overlay(cells), disabled=cell in overlay)
+        solara.Button("Clear overlay", on_click=lambda: set_overlay([]), disabled=not overlay)
+
+    solara.Title("TikTok Echo Chamber Sweep Comparison")
+    TrajectoryPlot(aggregates, cells, metric)
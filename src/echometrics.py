@@ -0,0 +1,189 @@
+"""Echo chamber metrics of TikTokEchoChamber runs, kept up to date incrementally.
+
+identify_clusters only counts cross-leaning interactions, and does so with a pass over all visible edges every
+step. EchoChamberMetrics instead keeps per state mixing counts of the visible network (a pair of nodes is
+connected when the edge is visible in either direction, as in identify_clusters) and a few per node counters,
+and updates them from the step's changes only: the edges whose weight was written and the agents whose state
+changed, which the model journals in touched_edges and touched_agents when echo_metrics is on::
+
+    model = TikTokEchoChamber(num_nodes=100000, echo_metrics=True)
+    model.step()
+    model.echo_metrics.summary()  # {"EI_Cons": ..., "Assortativity": ..., ...}, also collected every step
+    model.echo_metrics.cluster_homophily(model.cluster_stats.labels)
+
+An update costs time proportional to the number of touched edges plus the degrees of the agents that changed
+state, not to the size of the network.
+"""
+
+import numpy as np
+
+from src.agents import EDGE_INVISIBLE, AgentType, State
+
+# columns of summary(), in order
+SUMMARY_COLUMNS = (
+    "EI_Cons", "EI_Prog", "Assortativity", "Homophily", "Bot_Reach", "Bot_Reach_Cons", "Bot_Reach_Prog",
+)
+
+
+class EchoChamberMetrics:
+    """Incrementally maintained echo chamber measures of a model's visible network."""
+
+    def __init__(self, model):
+        """
+        Compute the metrics of the model's current states and edge weights from scratch.
+
+        Args:
+        :param model: The TikTokEchoChamber model to track
+        """
+        topology = model.topology
+        self._indptr = topology.indptr
+        self._src = topology.sources
+        self._dst = topology.indices
+        self._reverse = topology.reverse
+        num_nodes = topology.num_nodes
+
+        self.states = model.agent_state.copy()
+        self.is_bot = model.agent_type == AgentType.BOT
+        self.num_humans = int(num_nodes - self.is_bot.sum())
+
+        # every undirected pair is represented by the lower of its two directed edge ids
+        self._visible = np.zeros(len(self._dst), dtype=bool)
+        # mix[s, t]: visible pairs between a node in state s and one in state t, counted from both ends
+        #   (an internal pair of state s adds 2 to mix[s, s])
+        self.mix = np.zeros((len(State), len(State)), dtype=np.int64)
+        self.visible_degree = np.zeros(num_nodes, dtype=np.int32)
+        self.same_degree = np.zeros(num_nodes, dtype=np.int32)  # visible pairs with a node in the same state
+        # visible pairs of every human with bots of each leaning (indexed by State, bots are never neutral)
+        self.bot_links = np.zeros((num_nodes, 2), dtype=np.int32)
+
+        pairs = np.flatnonzero(np.arange(len(self._dst)) < self._reverse)
+        self._visible[pairs] = self._pair_visible(model.edge_weight, pairs)
+        self._apply(pairs, 1)
+        reached = self.bot_links[~self.is_bot] > 0
+        self.reached = reached.sum(axis=0)  # humans with a visible pair to a bot, per bot leaning
+        self.reached_any = int(reached.any(axis=1).sum())
+
+    def _pair_visible(self, edge_weight, pairs):
+        return (edge_weight[pairs] != EDGE_INVISIBLE) | (edge_weight[self._reverse[pairs]] != EDGE_INVISIBLE)
+
+    def _apply(self, pairs, sign):
+        """Add (sign 1) or remove (sign -1) the contribution of the visible ones of <pairs> to the counters."""
+        pairs = pairs[self._visible[pairs]]
+        u = self._src[pairs]
+        v = self._dst[pairs]
+        su = self.states[u]
+        sv = self.states[v]
+        np.add.at(self.mix, (su, sv), sign)
+        np.add.at(self.mix, (sv, su), sign)
+        np.add.at(self.visible_degree, u, sign)
+        np.add.at(self.visible_degree, v, sign)
+        same = su == sv
+        np.add.at(self.same_degree, u[same], sign)
+        np.add.at(self.same_degree, v[same], sign)
+        bot_u = self.is_bot[u]
+        bot_v = self.is_bot[v]
+        to_bot = bot_v & ~bot_u
+        from_bot = bot_u & ~bot_v
+        np.add.at(self.bot_links, (u[to_bot], sv[to_bot]), sign)
+        np.add.at(self.bot_links, (v[from_bot], su[from_bot]), sign)
+
+    def update(self, model):
+        """Apply the changes journaled in the model's touched_edges and touched_agents since the last update,
+        and clear the journals."""
+        edges = model.touched_edges
+        agents = model.touched_agents
+        if not edges and not agents:
+            return
+
+        # agents whose state differs from the tracked one, however often it changed in between
+        changed = {agent.pos: agent.state for agent in agents if agent.state != self.states[agent.pos]}
+        nodes = np.fromiter(changed, dtype=np.intp, count=len(changed))
+        new_states = np.fromiter(changed.values(), dtype=np.int8, count=len(changed))
+
+        # pairs whose contribution may change: the touched ones and every pair of a changed agent
+        indptr = self._indptr
+        touched = [np.asarray(edges, dtype=np.intp)]
+        touched.extend(np.arange(indptr[node], indptr[node + 1]) for node in changed)
+        touched = np.concatenate(touched)
+        pairs = np.unique(np.minimum(touched, self._reverse[touched]))
+
+        # humans whose bot links may change, to update the reached counts
+        ends = np.concatenate([self._src[pairs], self._dst[pairs]])
+        humans = np.unique(ends[~self.is_bot[ends]])
+        before = self.bot_links[humans] > 0
+
+        self._apply(pairs, -1)
+        self.states[nodes] = new_states
+        self._visible[pairs] = self._pair_visible(model.edge_weight, pairs)
+        self._apply(pairs, 1)
+
+        after = self.bot_links[humans] > 0
+        self.reached += after.sum(axis=0) - before.sum(axis=0)
+        self.reached_any += int(after.any(axis=1).sum() - before.any(axis=1).sum())
+
+        edges.clear()
+        agents.clear()
+
+    @property
+    def num_pairs(self):
+        """Number of visible pairs."""
+        return int(self.mix.sum()) // 2
+
+    @property
+    def cross_interactions(self):
+        """Number of visible pairs between nodes in different states (identify_clusters' count)."""
+        return (int(self.mix.sum()) - int(np.trace(self.mix))) // 2
+
+    def ei_index(self, state):
+        """Krackhardt's E-I index of <state>: (external - internal) / (external + internal) visible pairs of
+        its nodes. -1 when its nodes are only connected among themselves, 1 when only to other states."""
+        internal = int(self.mix[state, state]) // 2
+        external = int(self.mix[state].sum()) - int(self.mix[state, state])
+        total = internal + external
+        return (external - internal) / total if total else 0
+
+    def assortativity(self):
+        """Newman's assortativity coefficient of the visible network by agent state. 0 when undefined."""
+        total = self.mix.sum()
+        if not total:
+            return 0
+        e = self.mix / total
+        a = e.sum(axis=1)
+        expected = float(a @ a)
+        return (float(np.trace(e)) - expected) / (1 - expected) if expected < 1 else 0
+
+    def homophily(self):
+        """Share of visible pairs between nodes in the same state."""
+        total = int(self.mix.sum())
+        return int(np.trace(self.mix)) / total if total else 0
+
+    def bot_reach_share(self, state=None):
+        """Share of human agents with a visible pair to a bot (of leaning <state>, or of any leaning)."""
+        if not self.num_humans:
+            return 0
+        reached = self.reached_any if state is None else int(self.reached[state])
+        return reached / self.num_humans
+
+    def cluster_homophily(self, labels):
+        """Homophily of every cluster: the share of its nodes' visible pairs that are with nodes in the same
+        state, i.e. that stay inside the cluster when clusters are the connected groups of same state nodes.
+
+        Returns (cluster labels, homophily) with the labels in increasing order and 0 for isolated clusters.
+        Costs a pass over the nodes, not the edges.
+        """
+        clusters, index = np.unique(labels, return_inverse=True)
+        degree = np.bincount(index, weights=self.visible_degree, minlength=len(clusters))
+        same = np.bincount(index, weights=self.same_degree, minlength=len(clusters))
+        return clusters, np.divide(same, degree, out=np.zeros(len(clusters)), where=degree > 0)
+
+    def summary(self):
+        """The scalar metrics, keyed by SUMMARY_COLUMNS."""
+        return dict(zip(SUMMARY_COLUMNS, (
+            self.ei_index(State.CONSERVATIVE),
+            self.ei_index(State.PROGRESSIVE),
+            self.assortativity(),
+            self.homophily(),
+            self.bot_reach_share(),
+            self.bot_reach_share(State.CONSERVATIVE),
+            self.bot_reach_share(State.PROGRESSIVE),
+        )))
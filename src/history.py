@@ -0,0 +1,102 @@
+"""Compact per-agent history of TikTokEchoChamber runs.
+
+Mesa's agent reporters keep a tuple per agent per step, which batch_run then turns into a dict per agent
+per step carrying every parameter and model value again. AgentHistory keeps one small integer attribute
+(like reach) of all agents, or of a random sample of them, as a single (steps x agents) int16 array, and
+summarizes it per step (mean, quantiles, histograms) without materializing rows::
+
+    model = TikTokEchoChamber(num_nodes=1000, reach_sample=100)
+    ...
+    model.reach_history.quantiles((0.1, 0.5, 0.9))  # (3, steps)
+    model.reach_history.to_dataframe("Reach")  # like DataCollector.get_agent_vars_dataframe()
+"""
+
+import numpy as np
+
+
+class AgentHistory:
+    """Per step values of one integer agent attribute, stored as a (steps, agents) int16 array."""
+
+    def __init__(self, num_agents, sample=None, rng=None):
+        """
+        Create an empty history.
+
+        Args:
+        :param num_agents: Number of agents in the model
+        :param sample: Agents to keep: None for all of them, a number of agents drawn at random with <rng>,
+            or a list of agent (node) indices
+        :param rng: numpy Generator used to draw the sample
+        """
+        if sample is None:
+            agents = np.arange(num_agents)
+        elif np.isscalar(sample):
+            rng = rng if rng is not None else np.random.default_rng()
+            agents = np.sort(rng.choice(num_agents, size=min(int(sample), num_agents), replace=False))
+        else:
+            agents = np.unique(np.asarray(sample, dtype=np.int64))
+        self.num_agents = num_agents
+        self.agents = agents  # indices of the kept agents, sorted
+        self._data = np.empty((16, len(agents)), dtype=np.int16)
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def append(self, values):
+        """Store the next step's values of the kept agents (in self.agents order)."""
+        if self._len == len(self._data):
+            grown = np.empty((max(16, 2 * len(self._data)), len(self.agents)), dtype=np.int16)
+            grown[:self._len] = self._data[:self._len]
+            self._data = grown
+        info = np.iinfo(np.int16)
+        self._data[self._len] = np.clip(values, info.min, info.max)
+        self._len += 1
+
+    @property
+    def values(self):
+        """(steps, agents) array of the stored values."""
+        return self._data[:self._len]
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes
+
+    def mean(self):
+        """Mean over the kept agents at every step."""
+        return self.values.mean(axis=1) if len(self.agents) else np.zeros(self._len)
+
+    def quantiles(self, q=(0.1, 0.5, 0.9)):
+        """(len(q), steps) quantiles over the kept agents at every step."""
+        return np.quantile(self.values, q, axis=1)
+
+    def histogram(self, bins):
+        """(steps, len(bins) - 1) number of kept agents per bin at every step. Bins are half open [lo, hi)
+        like numpy.histogram's, except the last one which includes hi."""
+        bins = np.asarray(bins)
+        num_bins = len(bins) - 1
+        which = np.searchsorted(bins, self.values, side="right") - 1
+        which[self.values == bins[-1]] = num_bins - 1
+        inside = (which >= 0) & (which < num_bins)
+        steps = np.broadcast_to(np.arange(self._len)[:, None], which.shape)
+        flat = steps[inside] * num_bins + which[inside]
+        return np.bincount(flat, minlength=self._len * num_bins).reshape(self._len, num_bins)
+
+    def to_dataframe(self, name="value"):
+        """Long format DataFrame indexed by (Step, AgentID), like DataCollector.get_agent_vars_dataframe().
+        AgentIDs are mesa's agent ids (node index + 1, see TikTokAgent.unique_id), not the node indices
+        of self.agents."""
+        import pandas as pd
+
+        index = pd.MultiIndex.from_product([range(self._len), self.agents + 1], names=["Step", "AgentID"])
+        return pd.DataFrame({name: self.values.ravel()}, index=index)
+
+    def save(self, path):
+        np.savez_compressed(path, num_agents=self.num_agents, agents=self.agents, values=self.values)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        history = cls(int(data["num_agents"]), sample=data["agents"])
+        history._data = data["values"].copy()
+        history._len = len(history._data)
+        return history
@@ -1,17 +1,32 @@
+import copy
 import math
+import time
+import weakref
+from typing import NamedTuple
 
-import networkx as nx
+import numpy as np
 import mesa
 from mesa import Model
-from src.agents import State, TikTokAgent, AgentType, EdgeWeight
+from src.agents import (
+    State, TikTokAgent, AgentType, EventKind, BASE_REACH_HUMAN, EDGE_INVISIBLE, EDGE_VISIBLE, EDGE_WEIGHTS,
+    commit_interactions
+)
+from src.clusterstore import ClusterStore
+from src.echometrics import SUMMARY_COLUMNS, EchoChamberMetrics
+from src.history import AgentHistory
+from src.monitor import MetricsEmitter
+from src.replay import EventLog
+from src.termination import DEFAULT_TERMINATION
+from src.topology import Topology
 
 
 def number_state(model, state):
-    return sum(1 for a in model.grid.get_all_cell_contents() if a.state is state)
+    # kept up to date by TikTokAgent.set_state
+    return model.state_counts[state]
 
 
 def number_type(model, type):
-    return sum(1 for a in model.grid.get_all_cell_contents() if a.type is type)
+    return int(np.count_nonzero(model.agent_type == type))
 
 
 def number_conservative(model):
@@ -26,64 +41,54 @@ def number_neutral(model):
     return number_state(model, State.NEUTRAL)
 
 
+def avg_bot_reach(model, state):
+    # get the average reach of all bots of <state>
+    bots = (model.agent_type == AgentType.BOT) & (model.agent_state == state)
+    count = int(np.count_nonzero(bots))
+    return int(model.agent_reach[bots].sum()) / count if count else 0
+
+
 def num_cons_clusters(model):
     # get the average reach of all conservative bots
-    reach = 0
-    count = 0
-
-    for agent in model.grid.agents:
-        if agent.type == AgentType.BOT and agent.state == State.CONSERVATIVE:
-            reach += agent.reach
-            count += 1
-    return reach/count
+    return avg_bot_reach(model, State.CONSERVATIVE)
 
 
 def avg_cons_bot_reach(model):
     # get the average reach of all conservative bots
-    reach = 0
-    count = 0
-    reaches = []
-
-    for agent in model.grid.agents:
-        if agent.type == AgentType.BOT and agent.state == State.CONSERVATIVE:
-            reaches.append(agent.reach)
-            reach += agent.reach
-            count += 1
-    return reach/count
+    return avg_bot_reach(model, State.CONSERVATIVE)
 
 
 def avg_prog_bot_reach(model):
     # get the average reach of all progressive bots
-    reach = 0
-    count = 0
-    for agent in model.grid.agents:
-        if agent.type == AgentType.BOT and agent.state == State.PROGRESSIVE:
-            reach += agent.reach
-            count += 1
-    return reach/count
+    return avg_bot_reach(model, State.PROGRESSIVE)
 
 
 def get_unique_edge_list(edges):
     unique_edge_list = []
+    seen = set()
     for u, v in edges:
-        if (u, v) not in unique_edge_list and (v, u) not in unique_edge_list:
+        if (u, v) not in seen and (v, u) not in seen:
+            seen.add((u, v))
             unique_edge_list.append((u, v))
 
     return unique_edge_list
 
 
-def identify_clusters(model) -> tuple[list, int, float, float, int, int, int, int, int]:
-    """Group nodes by similarity and connectedness. Returns a list of:
-        [0]: list of cluster ids for each node. 0-indexed.
-        [1]: number of clusters
-        [2]: avg_cluster_size
-        [3]: cluster_ratio
-        [4]: cross_interactions
-        [5]: average size of cons. cluster
-        [6]: average size of prog. cluster
-        [7]: number of conservative clusters
-        [8]: number of progressive clusters
-    """
+class ClusterStats(NamedTuple):
+    """Summary of the clusters of one step. Unpacks like the tuple identify_clusters used to return."""
+    labels: np.ndarray  # cluster id of each node: the id of the node the cluster's label came from
+    num_clusters: int
+    avg_cluster_size: int
+    cluster_ratio: float
+    cross_interactions: int
+    cons_avg_cluster_size: int  # 0 when there are no conservative clusters
+    prog_avg_cluster_size: int  # 0 when there are no progressive clusters
+    num_cons_clusters: int
+    num_prog_clusters: int
+
+
+def identify_clusters(model) -> ClusterStats:
+    """Group nodes by similarity and connectedness and summarize the clusters (see ClusterStats)."""
 
     # Cluster Definition: a group of nodes:
     # - with similar leaning
@@ -91,69 +96,86 @@ def identify_clusters(model) -> tuple[list, int, float, float, int, int, int, in
     # ie: there exists a path from each node to every other node without going through a dissimilar node
 
     # the cluster id for each node is initialized to the node's id
-    clusters = [node for node in model.G.nodes()]
+    clusters = list(range(model.num_nodes))
+    topology = model.topology
+    states = model.agent_state
 
     '''if an edge is not invisible either way then they are connected'''
-    all_visible_edges = [(u, v) for u, v in model.G.edges()
-                         if model.G[u][v]['weight'] != EdgeWeight.INVISIBLE or
-                         model.G[v][u]['weight'] != EdgeWeight.INVISIBLE]
-    visible_edges = get_unique_edge_list(all_visible_edges)  # get unique pairs since edges may be dupes eg.(1,3), (3,1)
+    visible = model.edge_weight != EDGE_INVISIBLE
+    visible |= visible[topology.reverse]
+    visible &= topology.sources < topology.indices  # get unique pairs since edges are stored both ways eg.(1,3), (3,1)
+    us = topology.sources[visible]
+    vs = topology.indices[visible]
+    similar = states[us] == states[vs]
+    cross_interactions = int(np.count_nonzero(~similar))  # cross-cluster interactions
+    visible_edges = list(zip(us[similar].tolist(), vs[similar].tolist()))
 
     # try to find connected similar nodes and update their cluster id. note that edges are ordered.
     #   do it twice to ensure earlier nodes are updated
     for _ in [1, 2]:
-        cross_interactions = 0
         for u, v in visible_edges:
-            agent_u = model.grid.get_cell_list_contents([u])[0]
-            agent_v = model.grid.get_cell_list_contents([v])[0]
+            # make cluster ids of similar connected agents the same
             min_id = min(clusters[u], clusters[v])
+            clusters[u] = min_id
+            clusters[v] = min_id
 
-            # check similarity of agents
-            if agent_u.state == agent_v.state:
-                # make cluster ids the same
-                clusters[u] = min_id
-                clusters[v] = min_id
-            else:
-                cross_interactions += 1  # update cross-cluster interactions
+    # relabel cluster ids to 0..number_cluster-1 to count cluster sizes, and take each cluster's leaning
+    #   from its first node (all nodes of a cluster share a leaning)
+    labels = np.array(clusters, dtype=np.int64)
+    _, first_node, relabeled = np.unique(labels, return_index=True, return_inverse=True)
+    sizes = np.bincount(relabeled)
+    leanings = states[first_node]
 
-    # prep return values
-    unique_clusters = set(clusters)
-    number_cluster = len(unique_clusters)
+    number_cluster = len(sizes)
     cluster_ratio = number_cluster / model.num_nodes if model.num_nodes > 0 else 0
+    avg_cluster_size = round(model.num_nodes / number_cluster) if number_cluster else 0
 
-    sum_size = sum(clusters.count(c) for c in unique_clusters)
-    avg_cluster_size = round(sum_size / number_cluster)
+    # find avg cluster size for each leaning
+    counts = np.bincount(leanings, minlength=len(State))
+    size_sums = np.bincount(leanings, weights=sizes, minlength=len(State))
+    cons_count = int(counts[State.CONSERVATIVE])
+    prog_count = int(counts[State.PROGRESSIVE])
+    cons_clstr_avg_size = int(size_sums[State.CONSERVATIVE]) // cons_count if cons_count else 0
+    prog_clstr_avg_size = int(size_sums[State.PROGRESSIVE]) // prog_count if prog_count else 0
+
+    return ClusterStats(labels, number_cluster, avg_cluster_size, cluster_ratio, cross_interactions,
+                        cons_clstr_avg_size, prog_clstr_avg_size, cons_count, prog_count)
+
+
+def read_bot_file(path, topology):
+    """Read bot placement from a node attribute file with one "<node id> <leaning>" pair per line, where leaning
+    is conservative or progressive (or just c/p). Node ids are the graph's original ids.
+    Returns the node indices of the conservative and of the progressive bots."""
+    cons_ids = []
+    prog_ids = []
+    with open(path) as f:
+        for line in f:
+            line = line.split("#", 1)[0].replace(",", " ").split()
+            if not line:
+                continue
+            node_id, leaning = line[0], line[1].lower()
+            if leaning.startswith("c"):
+                cons_ids.append(int(node_id))
+            elif leaning.startswith("p"):
+                prog_ids.append(int(node_id))
+            else:
+                raise ValueError(f"unknown leaning {line[1]!r} for node {node_id} in {path}")
+    return topology.node_index(cons_ids).tolist(), topology.node_index(prog_ids).tolist()
 
-    # get each cluster and the nodes in it
-    cluster_dict = {}
-    for node, cluster_id in enumerate(clusters):
-        if cluster_id not in cluster_dict:
-            cluster_dict[cluster_id] = []
-        cluster_dict[cluster_id].append(node)
 
-    # find avg cluster size for each leaning
-    cons_clstr_size = 0
-    cons_count = 0
-    prog_clstr_size = 0
-    prog_count = 0
-    for cluster_id, node_list in cluster_dict.items():
-        if model.grid.get_cell_list_contents([node_list[0]])[0].state == State.CONSERVATIVE:
-            cons_clstr_size += len(node_list)
-            cons_count += 1
-        if model.grid.get_cell_list_contents([node_list[0]])[0].state == State.PROGRESSIVE:
-            prog_clstr_size += len(node_list)
-            prog_count += 1
-
-    cons_clstr_avg_size = cons_clstr_size // cons_count
-    prog_clstr_avg_size = prog_clstr_size // prog_count
-
-    # print(f"cons_clstr_size {cons_clstr_size} ")
-    # print(f"prog_clstr_size {prog_clstr_size} ")
-    # print(f"cons_clstr_avg_size {cons_clstr_avg_size} ")
-    # print(f"prog_clstr_avg_size {prog_clstr_avg_size} ")
-
-    return clusters, number_cluster, avg_cluster_size, cluster_ratio, cross_interactions, \
-        cons_clstr_avg_size, prog_clstr_avg_size, cons_count, prog_count
+def echo_metric(column):
+    """Reporter of one column of the model's EchoChamberMetrics summary"""
+    def reporter(model):
+        return model.echo_summary[column]
+    return reporter
+
+
+def _close_outputs(metrics, event_log, event_log_path):
+    # outputs the model created itself: kept free of the model so a weakref.finalize can run it
+    if metrics is not None:
+        metrics.close()
+    if event_log_path is not None:
+        event_log.save(event_log_path)
 
 
 def cons_progressive_ratio(self):
@@ -180,6 +202,14 @@ class TikTokEchoChamber(Model):
             positive_chance=0.8,
             become_neutral_chance=0.2,
             seed=None,
+            metrics=None,
+            termination=None,
+            event_log=None,
+            graph=None,
+            bots=None,
+            update_mode="sequential",
+            reach_sample=None,
+            echo_metrics=False,
     ):
         """
         Create a new TikTokEchoChamber model.
@@ -192,13 +222,39 @@ class TikTokEchoChamber(Model):
         :param positive_chance: Probability of an agent to have positive interactions with others (0-1)
         :param become_neutral_chance: Probability of an agent to become neutral (0-1)
         :param seed: Seed for reproducibility
+        :param metrics: MetricsEmitter, or a target for one (NDJSON file path or "udp://host:port"),
+            to publish per-step metrics to while the model runs
+        :param termination: List of stopping criteria from src.termination, checked after every step.
+            Defaults to stopping once no agent is neutral, which runs with a become_neutral_chance may never
+            reach; add SteadyState() to stop those once their counts only fluctuate
+        :param event_log: EventLog, or a .npz path to save one to when the run is closed (see close), recording
+            every interaction for offline replay (see src.replay)
+        :param graph: Prebuilt network to run on instead of generating one: a Topology, the path of a saved
+            topology (.npz), the prefix of memory-mapped CSR files, or a text edge list (converted to CSR files
+            on first use). num_nodes is then taken from the graph
+        :param bots: Node attribute file placing the bots (see read_bot_file). Replaces the random placement
+            of num_cons_bots and num_prog_bots
+        :param update_mode: "sequential" (agents change each other's states as soon as they interact, so later
+            agents in the step see the changes) or "two_phase" (interactions only buffer their hits, and the
+            state changes of the whole step are applied at once at its end, see commit_interactions)
+        :param reach_sample: Agents whose reach is kept at every step in reach_history (see src.history): None
+            for all agents, a number of agents drawn at random, or a list of nodes
+        :param echo_metrics: Keep echo chamber metrics (E-I indices, assortativity, homophily, bot reach) up to
+            date from every step's changes and collect them (see src.echometrics)
         """
+        if update_mode not in ("sequential", "two_phase"):
+            raise ValueError(f"update_mode must be 'sequential' or 'two_phase', got {update_mode!r}")
         super().__init__(seed=seed)
+        if graph is not None:
+            self.topology = graph if isinstance(graph, Topology) else Topology.load(graph)
+            num_nodes = self.topology.num_nodes
+        else:
+            self.topology = self.make_topology(num_nodes, avg_node_degree, seed)
         self.num_nodes = num_nodes
-        prob = avg_node_degree / self.num_nodes # this is for the probability for an edge to be connected
-        self.G = nx.powerlaw_cluster_graph(n=num_nodes, m=avg_node_degree, p=prob, seed=seed)  # to increase likelihood that all nodes are connected
-        self.grid = mesa.space.NetworkGrid(self.G)
-        self.G = self.G.to_directed()
+
+        # weight of every directed edge (as an EDGE_WEIGHTS code), indexed by the topology's edge ids.
+        #   all edges start invisible such that the graph looks disconnected at the start
+        self.edge_weight = np.full(len(self.topology.indices), EDGE_INVISIBLE, dtype=np.int8)
 
         # determine number of bots for each political leaning
         num_bots = num_cons_bots + num_prog_bots
@@ -211,121 +267,302 @@ class TikTokEchoChamber(Model):
             self.num_cons_bots = half
             self.num_prog_bots = half
 
+        # agent parameters shared by every agent; agents read them from the model instead of keeping copies
+        self.max_reach = avg_node_degree
         self.positive_chance = positive_chance
         self.become_neutral_chance = become_neutral_chance
 
         # keep track of each interaction per step
         self.interactions = ""
-        self.pos = nx.spring_layout(self.G, k=0.3, iterations=20, seed=seed)
 
+        # two-phase update mode: hits (target, edge, leaning, weight) and agents turning neutral buffered during
+        #   the step, and the agents whose state changed when it was committed. The buffers are None when
+        #   sequential, which makes agents apply their interactions right away
+        self.update_mode = update_mode
+        self.pending_hits = [] if update_mode == "two_phase" else None
+        self.pending_neutral = [] if update_mode == "two_phase" else None
+        self.changed_agents = []
+
+        # journals of the edges whose weight was written and the agents whose state changed since the last
+        #   echo metrics update. None unless echo_metrics is on
+        self.touched_edges = [] if echo_metrics else None
+        self.touched_agents = [] if echo_metrics else None
+
+        # number of agents in each state, indexed by State
+        self.state_counts = [0] * len(State)
+
+        # stopping criteria; copied since they keep per-run history
+        self.termination = copy.deepcopy(list(termination if termination is not None else DEFAULT_TERMINATION))
+        self.stop_reason = None
+
+        # optional live metrics feed. An emitter created here from a target is closed when the run is closed
+        owned_metrics = None
+        if isinstance(metrics, str):
+            metrics = owned_metrics = MetricsEmitter(metrics)
+        self.metrics = metrics
+
+        # optional interaction event log. One created here from a path is saved there when the run is closed
+        event_log_path = event_log if isinstance(event_log, str) else None
+        if event_log_path is not None:
+            event_log = EventLog()
+        self.event_log = event_log
+
+        # the run is closed by close(): when a termination criterion stops it, by whoever drives it otherwise,
+        #   and at the latest when the model is garbage collected or the interpreter exits
+        self._finalizer = None
+        if owned_metrics is not None or event_log_path is not None:
+            self._finalizer = weakref.finalize(self, _close_outputs, owned_metrics, event_log, event_log_path)
+
+        # node layout is only needed for visualization, so it is computed on first access of self.pos
+        self._layout_seed = seed
+        self._pos = None
+
+        model_reporters = {
+            "Conservative": number_conservative,
+            "Progressive": number_progressive,
+            "Neutral": number_neutral,
+            "Avg_Cons_Bot_Reach": avg_cons_bot_reach,
+            "Avg_Prog_Bot_Reach": avg_prog_bot_reach
+        }
+        if echo_metrics:
+            model_reporters.update({column: echo_metric(column) for column in SUMMARY_COLUMNS})
         self.datacollector = mesa.DataCollector(
-            model_reporters={
-                "Conservative": number_conservative,
-                "Progressive": number_progressive,
-                "Neutral": number_neutral,
-                "Avg_Cons_Bot_Reach": avg_cons_bot_reach,
-                "Avg_Prog_Bot_Reach": avg_prog_bot_reach
-            },
-            agent_reporters={
-                "Reach": "reach"
-            },
+            model_reporters=model_reporters,
             tables={
-                "CA": ["Clusters", "Num_Clusters", "Num_Cons_Clusters", "Num_Prog_Clusters", "Avg_Cluster_Size",
+                "CA": ["Num_Clusters", "Num_Cons_Clusters", "Num_Prog_Clusters", "Avg_Cluster_Size",
                        "Clstr_Agent_Ratio", "Cross_Interactions",
                        "Cons_Avg_Cluster_Size", "Prog_Avg_Cluster_Size"]
             }
         )
-
-        # Initialize the grid
-
-        # Try to use a more efficient layout algorithm
-        try:
-            # Use kamada_kawai for smaller networks (more aesthetically pleasing)
-            if len(self.G.nodes()) <= 30:
-                self.pos = nx.kamada_kawai_layout(self.G)
-            else:
-                # Use spring layout with limited iterations for larger networks
-                self.pos = nx.spring_layout(self.G, k=0.3, iterations=50, seed=seed)
-        except:
-            # Fallback to basic spring layout with few iterations
-            pass
-
-        # Create agents as human and neutral first
-        idCounter = 0
-        for node in self.G.nodes():
-
-            a = TikTokAgent(
-                id_=idCounter,
-                model=self,
-                agent_type=AgentType.HUMAN,
-                initial_state=State.NEUTRAL,
-                max_reach=avg_node_degree,
-                positive_chance=self.positive_chance,
-                become_neutral_chance=self.become_neutral_chance,
-            )
-            idCounter += 1
-            # Attach the agent to the node
-            self.grid.place_agent(a, node)
-
-        # Make equal count conservative and progressive bot nodes.
-        cons_nodes = self.random.sample(list(self.G), self.num_cons_bots)
-        for a in self.grid.get_cell_list_contents(cons_nodes):
+        # cluster id of every node at every step, kept out of the CA table as keyframes + sparse deltas
+        self.cluster_history = ClusterStore()
+        # reach of every (or every sampled) agent at every step, as a compact int16 array instead of agent reporter rows
+        self.reach_history = AgentHistory(num_nodes, sample=reach_sample, rng=self.rng)
+
+        # Per-agent state, indexed by node like edge_weight is by edge. Agents start as neutral humans with the
+        #   base human reach (bots keep it, they are only turned into bots below)
+        self.agent_state = np.full(num_nodes, State.NEUTRAL, dtype=np.int8)
+        self.agent_type = np.full(num_nodes, AgentType.HUMAN, dtype=np.int8)
+        # cumulative interaction weights received from each leaning
+        self.agent_hit_cons = np.zeros(num_nodes, dtype=np.int32)
+        self.agent_hit_prog = np.zeros(num_nodes, dtype=np.int32)
+        self.agent_reach = np.full(num_nodes, BASE_REACH_HUMAN, dtype=np.int32)
+        self.state_counts[State.NEUTRAL] = num_nodes
+
+        # agent_at maps each node to its agent, a view over the arrays above
+        self.agent_at = [TikTokAgent(self, node) for node in range(num_nodes)]
+
+        # Make equal count conservative and progressive bot nodes, unless the bots are placed from a file.
+        if bots is not None:
+            cons_nodes, prog_nodes = read_bot_file(bots, self.topology)
+            self.num_cons_bots = len(cons_nodes)
+            self.num_prog_bots = len(prog_nodes)
+        else:
+            cons_nodes = self.random.sample(range(num_nodes), self.num_cons_bots)
+        for node in cons_nodes:
+            a = self.agent_at[node]
             a.type = AgentType.BOT
-            a.state = State.CONSERVATIVE
-        no_cons_list = list(set(list(self.G)) - set(cons_nodes))  # ensure no overlap between cons and prog nodes
-        prog_nodes = self.random.sample(no_cons_list, self.num_prog_bots)
-        for a in self.grid.get_cell_list_contents(prog_nodes):
+            a.set_state(State.CONSERVATIVE)
+        if bots is None:
+            no_cons_list = list(set(range(num_nodes)) - set(cons_nodes))  # ensure no overlap between cons and prog nodes
+            prog_nodes = self.random.sample(no_cons_list, self.num_prog_bots)
+        for node in prog_nodes:
+            a = self.agent_at[node]
             a.type = AgentType.BOT
-            a.state = State.PROGRESSIVE
+            a.set_state(State.PROGRESSIVE)
 
-        # Add edge weights based on political similarity such that the graph looks disconnected at the start
-        for u, v in self.G.edges():
-            self.G[u][v]['weight'] = EdgeWeight.INVISIBLE
+        if self.event_log is not None:
+            self.event_log.start(self)
+
+        # optional echo chamber metrics, computed once here and then updated from the journals every step
+        self.echo_metrics = None
+        self.echo_summary = None
+        self.cluster_homophily = None
+        if echo_metrics:
+            self.echo_metrics = EchoChamberMetrics(self)
+            self.touched_edges.clear()
+            self.touched_agents.clear()
+            self.echo_summary = self.echo_metrics.summary()
 
         self.running = True
-        clusters, number_cluster, avg_cluster_size, cluster_ratio, cross_interactions, \
-            cons_clstr_avg_size, prog_clstr_avg_size, cons_count, prog_count = identify_clusters(self)
+        self.record_clusters()
+        self.datacollector.collect(self)
+        self.record_reach()
+
+    def record_clusters(self):
+        """Identify this step's clusters, keep their labels in the cluster history and add them to the CA table."""
+        stats = self.cluster_stats = identify_clusters(self)
+        self.cluster_history.append(stats.labels)
+        if self.echo_metrics is not None:
+            self.cluster_homophily = self.echo_metrics.cluster_homophily(stats.labels)
         self.datacollector.add_table_row(
             table_name="CA",
             row={
-                "Clusters": clusters,
-                "Num_Clusters": number_cluster,
-                "Num_Cons_Clusters": cons_count,
-                "Num_Prog_Clusters": prog_count,
-                "Avg_Cluster_Size": avg_cluster_size,
-                "Clstr_Agent_Ratio": cluster_ratio,
-                "Cross_Interactions": cross_interactions,
-                "Cons_Avg_Cluster_Size": cons_clstr_avg_size,
-                "Prog_Avg_Cluster_Size": prog_clstr_avg_size,
+                "Num_Clusters": stats.num_clusters,
+                "Num_Cons_Clusters": stats.num_cons_clusters,
+                "Num_Prog_Clusters": stats.num_prog_clusters,
+                "Avg_Cluster_Size": stats.avg_cluster_size,
+                "Clstr_Agent_Ratio": stats.cluster_ratio,
+                "Cross_Interactions": stats.cross_interactions,
+                "Cons_Avg_Cluster_Size": stats.cons_avg_cluster_size,
+                "Prog_Avg_Cluster_Size": stats.prog_avg_cluster_size,
             }
         )
-        self.datacollector.collect(self)
+
+    def record_reach(self):
+        """Add the current reach of the sampled agents to reach_history."""
+        self.reach_history.append(self.agent_reach[self.reach_history.agents])
+
+    def commit_interactions(self):
+        """Commit phase of the two-phase update mode: apply the hits and neutrality buffered during the step in
+        one go (see src.agents.commit_interactions) and return the agents whose state changed."""
+        hits = self.pending_hits
+        neutral = self.pending_neutral
+
+        # only the agents involved in the step's interactions take part in the commit
+        involved = {}
+        for agent, _, _, _ in hits:
+            involved.setdefault(agent.pos, agent)
+        for agent in neutral:
+            involved.setdefault(agent.pos, agent)
+        agents = list(involved.values())
+        index = {pos: i for i, pos in enumerate(involved)}
+
+        nodes = np.fromiter(involved, dtype=np.intp, count=len(agents))
+        states = self.agent_state[nodes]
+        hit_cons = self.agent_hit_cons[nodes]
+        hit_prog = self.agent_hit_prog[nodes]
+        targets = np.array([index[agent.pos] for agent, _, _, _ in hits], dtype=np.intp)
+        edges = np.array([edge for _, edge, _, _ in hits], dtype=np.intp)
+        leanings = np.array([leaning for _, _, leaning, _ in hits], dtype=np.int8)
+        weights = np.array([weight for _, _, _, weight in hits], dtype=np.int32)
+        became_neutral = np.zeros(len(agents), dtype=bool)
+        became_neutral[[index[a.pos] for a in neutral]] = True
+
+        connects, disconnects = commit_interactions(
+            states, hit_cons, hit_prog, targets, leanings, weights, became_neutral, self.rng.random(len(agents))
+        )
+        self.edge_weight[edges[connects]] = EDGE_VISIBLE
+        self.edge_weight[edges[disconnects]] = EDGE_INVISIBLE
+
+        if self.event_log is not None:
+            sources = self.topology.sources
+            for i in np.flatnonzero(became_neutral).tolist():
+                self.event_log.record(agents[i].pos, -1, EventKind.NEUTRAL, 0, agents[i].state)
+            for i in np.flatnonzero(connects).tolist():
+                self.event_log.record(int(sources[edges[i]]), hits[i][0].pos, EventKind.CONNECT, 0, leanings[i])
+            for i in np.flatnonzero(disconnects).tolist():
+                self.event_log.record(int(sources[edges[i]]), hits[i][0].pos, EventKind.DISCONNECT, 0, leanings[i])
+
+        self.agent_hit_cons[nodes] = hit_cons
+        self.agent_hit_prog[nodes] = hit_prog
+        changed = []
+        for i in np.flatnonzero(states != self.agent_state[nodes]).tolist():
+            agents[i].set_state(State(states[i]))
+            changed.append(agents[i])
+
+        hits.clear()
+        neutral.clear()
+        return changed
+
+    @staticmethod
+    def make_topology(num_nodes, avg_node_degree, seed=None):
+        """The network a model with these parameters generates. Depends on nothing else, so models that only
+        differ in other parameters can run on one shared Topology passed as graph."""
+        prob = avg_node_degree / num_nodes  # this is for the probability for an edge to be connected
+        return Topology.powerlaw_cluster(n=num_nodes, m=avg_node_degree, p=prob, seed=seed)  # to increase likelihood that all nodes are connected
+
+    @property
+    def pos(self):
+        """Node positions for drawing the network. Computed lazily so headless runs skip the layout cost."""
+        if self._pos is None:
+            import networkx as nx
+
+            G = self.topology.to_networkx()
+            # Try to use a more efficient layout algorithm
+            try:
+                # Use kamada_kawai for smaller networks (more aesthetically pleasing)
+                if self.num_nodes <= 30:
+                    self._pos = nx.kamada_kawai_layout(G)
+                else:
+                    # Use spring layout with limited iterations for larger networks
+                    self._pos = nx.spring_layout(G, k=0.3, iterations=50, seed=self._layout_seed)
+            except Exception:
+                # Fallback to basic spring layout with few iterations
+                self._pos = nx.spring_layout(G, k=0.3, iterations=20, seed=self._layout_seed)
+        return self._pos
+
+    def to_networkx(self):
+        """The network as a networkx DiGraph with each edge's EdgeWeight as its 'weight' attribute, for drawing."""
+        import networkx as nx
+
+        G = nx.DiGraph()
+        G.add_nodes_from(range(self.num_nodes))
+        weights = [EDGE_WEIGHTS[code] for code in self.edge_weight.tolist()]
+        G.add_weighted_edges_from(zip(self.topology.sources.tolist(), self.topology.indices.tolist(), weights))
+        return G
+
+    def close(self):
+        """Close the run's outputs: save the event log to the path given as event_log and close the metrics
+        emitter created from a target. Done when a termination criterion stops the run; call it when a run
+        ends otherwise (cut off at a step limit, interactive sessions). Only the first call has an effect."""
+        if self._finalizer is not None:
+            self._finalizer()
 
     def step(self):
-        self.agents.shuffle_do("step")
+        t_start = time.perf_counter()
+        if self.event_log is not None:
+            self.event_log.begin_step(self.steps)
+        # activate every agent once in random order (what mesa's AgentSet.shuffle_do does for registered agents)
+        order = self.agent_at.copy()
+        self.random.shuffle(order)
+        for agent in order:
+            agent.step()
+        if self.pending_hits is not None:
+            self.changed_agents = self.commit_interactions()
+        if self.echo_metrics is not None:
+            self.echo_metrics.update(self)
+            self.echo_summary = self.echo_metrics.summary()
+        t_agents = time.perf_counter()
 
         # collect data
-        clusters, number_cluster, avg_cluster_size, cluster_ratio, cross_interactions, \
-            cons_clstr_avg_size, prog_clstr_avg_size, cons_count, prog_count = identify_clusters(self)
-        self.datacollector.add_table_row(
-            table_name="CA",
-            row={
-                "Clusters": clusters,
-                "Num_Clusters": number_cluster,
-                "Num_Cons_Clusters": cons_count,
-                "Num_Prog_Clusters": prog_count,
-                "Avg_Cluster_Size": avg_cluster_size,
-                "Clstr_Agent_Ratio": cluster_ratio,
-                "Cross_Interactions": cross_interactions,
-                "Cons_Avg_Cluster_Size": cons_clstr_avg_size,
-                "Prog_Avg_Cluster_Size": prog_clstr_avg_size
-            }
-        )
+        self.record_clusters()
+        t_clusters = time.perf_counter()
         self.datacollector.collect(self)
+        self.record_reach()
+        t_collect = time.perf_counter()
         # print(clusters)
         # print(self.datacollector.get_table_dataframe("CA"))
 
-        if number_neutral(self) == 0:
-            self.running = False
+        for criterion in self.termination:
+            if criterion(self):
+                self.running = False
+                self.stop_reason = criterion.reason
+                break
+
+        if self.metrics is not None:
+            model_vars = self.datacollector.model_vars
+            self.metrics.publish({
+                "step": self.steps,
+                "running": self.running,
+                "stop_reason": self.stop_reason,
+                "conservative": model_vars["Conservative"][-1],
+                "progressive": model_vars["Progressive"][-1],
+                "neutral": model_vars["Neutral"][-1],
+                "num_clusters": self.cluster_stats.num_clusters,
+                "num_cons_clusters": self.cluster_stats.num_cons_clusters,
+                "num_prog_clusters": self.cluster_stats.num_prog_clusters,
+                "cross_interactions": self.cluster_stats.cross_interactions,
+                **({"echo": self.echo_summary} if self.echo_summary is not None else {}),
+                "steps_per_sec": 1 / (t_collect - t_start),
+                "timing": {
+                    "agents": t_agents - t_start,
+                    "clusters": t_clusters - t_agents,
+                    "collect": t_collect - t_clusters,
+                },
+            })
+
+        if not self.running:
             self.datacollector.get_table_dataframe("CA").to_csv("CA.csv")
             self.datacollector.get_model_vars_dataframe().to_csv("model.csv")
+            self.close()
@@ -0,0 +1,112 @@
+"""Live metrics feed for running TikTokEchoChamber simulations.
+
+A MetricsEmitter publishes one JSON record per model step either to a newline-delimited JSON file
+(any path) or to a local UDP socket (``udp://host:port``). Records are handed to a background thread
+through a bounded queue, so publishing never blocks the simulation: when the queue is full the record
+is dropped and counted in ``dropped``.
+
+Follow a file feed with e.g. ``tail -f runs.ndjson``; several runs can append to the same file since
+every record is written as a single line.
+"""
+
+import json
+import os
+import queue
+import socket
+import threading
+
+_CLOSE = object()  # sentinel telling the writer thread to stop
+
+
+class MetricsEmitter:
+    """Non-blocking publisher of per-step metric records."""
+
+    def __init__(self, target, label=None, maxsize=1024):
+        """
+        Create a new metrics emitter and start its writer thread.
+
+        Args:
+        :param target: Path of a newline-delimited JSON file to append to, or "udp://host:port"
+        :param label: Identifies the run in every record. Defaults to the process id
+        :param maxsize: Max number of records waiting to be written before new ones are dropped
+        """
+        self.target = target
+        self.label = label if label is not None else str(os.getpid())
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._queue = queue.Queue(maxsize=maxsize)
+
+        if target.startswith("udp://"):
+            host, port = target[len("udp://"):].rsplit(":", 1)
+            self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self._address = (host, int(port))
+            self._file = None
+        else:
+            self._sock = None
+            # line buffered append so concurrent runs can share a file
+            self._file = open(target, "a", buffering=1)
+
+        self._thread = threading.Thread(target=self._write_loop, name="metrics-emitter", daemon=True)
+        self._thread.start()
+
+    def publish(self, record):
+        """Queue <record> (a JSON serializable dict) for writing. Never blocks."""
+        record = {"run": self.label, **record}
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self._count_dropped()
+
+    def _count_dropped(self, n=1):
+        # records are dropped both by publish (caller's thread) and by the writer thread
+        with self._dropped_lock:
+            self.dropped += n
+
+    def _write_loop(self):
+        try:
+            while not self._stop.is_set():
+                record = self._queue.get()
+                if record is _CLOSE:
+                    break
+                line = json.dumps(record, default=str)
+                try:
+                    if self._sock is not None:
+                        self._sock.sendto(line.encode(), self._address)
+                    else:
+                        self._file.write(line + "\n")
+                except OSError:
+                    # a dashboard that is not listening must never take the simulation down
+                    self._count_dropped()
+        finally:
+            # records still queued when the writer was stopped early are lost
+            self._count_dropped(sum(1 for record in self._drain() if record is not _CLOSE))
+            # the writer thread owns the file/socket, so they are only closed once it no longer writes to them
+            if self._file is not None:
+                self._file.close()
+            if self._sock is not None:
+                self._sock.close()
+
+    def _drain(self):
+        while True:
+            try:
+                yield self._queue.get_nowait()
+            except queue.Empty:
+                return
+
+    def close(self, timeout=5.0):
+        """Flush the queued records and stop the writer thread, which then closes the file or socket.
+
+        If the queue is still full after <timeout> seconds, the writer is told to stop after the record it is
+        writing and the remaining records are dropped."""
+        if not self._thread.is_alive():
+            return
+        try:
+            self._queue.put(_CLOSE, timeout=timeout)
+        except queue.Full:
+            self._stop.set()
+            try:
+                self._queue.put_nowait(_CLOSE)  # wakes the writer if it emptied the queue in the meantime
+            except queue.Full:
+                pass
+        self._thread.join(timeout)
@@ -0,0 +1,193 @@
+"""Interaction event log for TikTokEchoChamber runs and an offline replayer.
+
+With ``event_log`` set, the model records every interaction as a fixed size binary record
+(step, source, target, kind, weight, state). The log plus the initial agent states and the topology
+is enough to rebuild agent states and edge weights at any step, so new metrics can be computed
+from a saved run with NumPy instead of re-running the simulation::
+
+    model = TikTokEchoChamber(num_nodes=1000, seed=42, event_log="run.npz")
+    ...  # the log is saved to run.npz when the run stops
+
+    replay = Replay.load("run.npz")
+    replay.state_counts()  # (steps + 1, 3) agent counts per state after each step
+    for step, states in replay.iter_states():
+        ...
+"""
+
+import numpy as np
+
+from src.agents import EDGE_DASHED, EDGE_INVISIBLE, EDGE_VISIBLE, EventKind, State
+
+
+EVENT_DTYPE = np.dtype([
+    ("step", "<u4"),
+    ("source", "<i4"),
+    ("target", "<i4"),
+    ("kind", "u1"),
+    ("weight", "i1"),
+    ("state", "i1"),  # source's state at the time of the event
+])
+
+# edge weight each kind of event leaves on the source -> target edge
+_KIND_EDGE_WEIGHT = np.full(len(EventKind), -1, dtype=np.int8)
+_KIND_EDGE_WEIGHT[[EventKind.POSITIVE, EventKind.NEGATIVE]] = EDGE_DASHED
+_KIND_EDGE_WEIGHT[[EventKind.CONNECT, EventKind.BOT_LINK]] = EDGE_VISIBLE
+_KIND_EDGE_WEIGHT[EventKind.DISCONNECT] = EDGE_INVISIBLE
+
+
+class EventLog:
+    """Append-only recorder of model interaction events.
+
+    Events are buffered as tuples during a step and packed into a structured array when the step ends,
+    which keeps the recording cost in the agents' inner loops to a single list append.
+    """
+
+    def __init__(self):
+        self.step = 0
+        self._pending = []
+        self._chunks = []
+        self.initial_states = None
+        self.agent_types = None
+        self.edges = None
+
+    def start(self, model):
+        """Remember the model's initial agent states, agent types and (undirected) edges."""
+        self.initial_states = model.agent_state.copy()
+        self.agent_types = model.agent_type.copy()
+        topology = model.topology
+        once = topology.sources < topology.indices
+        self.edges = np.stack([topology.sources[once], topology.indices[once]], axis=1).astype(np.int32)
+
+    def begin_step(self, step):
+        self.flush()
+        self.step = step
+
+    def record(self, source, target, kind, weight, state):
+        self._pending.append((self.step, source, target, kind, weight, state))
+
+    def flush(self):
+        if self._pending:
+            self._chunks.append(np.array(self._pending, dtype=EVENT_DTYPE))
+            self._pending = []
+
+    @property
+    def events(self):
+        self.flush()
+        if not self._chunks:
+            return np.empty(0, dtype=EVENT_DTYPE)
+        if len(self._chunks) > 1:
+            self._chunks = [np.concatenate(self._chunks)]
+        return self._chunks[0]
+
+    def save(self, path):
+        np.savez_compressed(
+            path,
+            events=self.events,
+            initial_states=self.initial_states,
+            agent_types=self.agent_types,
+            edges=self.edges,
+            num_steps=self.step,
+        )
+
+
+class Replay:
+    """Rebuilds agent states and edge weights of a recorded run at any step."""
+
+    def __init__(self, events, initial_states, agent_types, edges, num_steps=None):
+        self.events = events
+        self.initial_states = initial_states
+        self.agent_types = agent_types
+        self.num_nodes = len(initial_states)
+        self.num_steps = int(num_steps) if num_steps is not None else int(events["step"].max(initial=0))
+
+        # directed edges (both directions of every undirected edge), sorted by key for lookups
+        edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+        directed = np.concatenate([edges, edges[:, ::-1]])
+        keys = directed[:, 0] * self.num_nodes + directed[:, 1]
+        order = np.argsort(keys)
+        self.directed_edges = directed[order]
+        self._edge_keys = keys[order]
+
+        # step boundaries into the (step sorted) event array
+        self._step_starts = np.searchsorted(events["step"], np.arange(self.num_steps + 2))
+
+        # state changes: connect changes the target, neutral changes the source
+        kinds = events["kind"]
+        connect = kinds == EventKind.CONNECT
+        neutral = kinds == EventKind.NEUTRAL
+        changed = connect | neutral
+        self._change_step = events["step"][changed]
+        self._change_node = np.where(connect, events["target"], events["source"])[changed]
+        self._change_state = np.where(connect, events["state"], State.NEUTRAL)[changed].astype(np.int8)
+
+    @classmethod
+    def from_log(cls, log):
+        return cls(log.events, log.initial_states, log.agent_types, log.edges, log.step)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        return cls(data["events"], data["initial_states"], data["agent_types"], data["edges"], data["num_steps"])
+
+    def _events_until(self, step):
+        return self.events[:self._step_starts[step + 1]]
+
+    def state_at(self, step):
+        """Agent states (indexed by node) after <step>. Step 0 is the initial state."""
+        states = self.initial_states.copy()
+        n = np.searchsorted(self._change_step, step, side="right")
+        _assign_last(states, self._change_node[:n], self._change_state[:n])
+        return states
+
+    def edge_weights_at(self, step):
+        """Edge weight codes (indices into EDGE_WEIGHTS) of self.directed_edges after <step>."""
+        weights = np.full(len(self._edge_keys), EDGE_INVISIBLE, dtype=np.int8)
+        events = self._events_until(step)
+        edge_weight = _KIND_EDGE_WEIGHT[events["kind"]]
+        events = events[edge_weight >= 0]
+        keys = events["source"].astype(np.int64) * self.num_nodes + events["target"]
+        _assign_last(weights, np.searchsorted(self._edge_keys, keys), edge_weight[edge_weight >= 0])
+        return weights
+
+    def iter_states(self):
+        """Yield (step, states) for every step, applying each step's state changes in one vectorized update.
+        The same array is updated in place; copy it to keep it."""
+        states = self.initial_states.copy()
+        bounds = np.searchsorted(self._change_step, np.arange(self.num_steps + 2))
+        for step in range(self.num_steps + 1):
+            lo, hi = bounds[step], bounds[step + 1]
+            _assign_last(states, self._change_node[lo:hi], self._change_state[lo:hi])
+            yield step, states
+
+    def state_counts(self):
+        """(num_steps + 1, len(State)) array of the number of agents in each state after every step."""
+        num_states = len(State)
+        # previous state of the node for every change: the previous change of the same node, or its initial state
+        order = np.lexsort((np.arange(len(self._change_node)), self._change_node))
+        nodes = self._change_node[order]
+        new = self._change_state[order]
+        prev = self.initial_states[nodes].copy()
+        same_node = np.r_[False, nodes[1:] == nodes[:-1]]
+        prev[same_node] = new[:-1][same_node[1:]]
+
+        deltas = np.zeros((self.num_steps + 1, num_states), dtype=np.int64)
+        steps = self._change_step[order]
+        np.add.at(deltas, (steps, new), 1)
+        np.add.at(deltas, (steps, prev), -1)
+        deltas[0] += np.bincount(self.initial_states, minlength=num_states)
+        return np.cumsum(deltas, axis=0)
+
+    def interaction_counts(self):
+        """(num_steps + 1, len(EventKind)) array of the number of events of each kind per step."""
+        counts = np.zeros((self.num_steps + 1, len(EventKind)), dtype=np.int64)
+        np.add.at(counts, (self.events["step"], self.events["kind"]), 1)
+        return counts
+
+
+def _assign_last(array, index, values):
+    """array[index] = values, where the last value wins for repeated indices."""
+    if len(index) == 0:
+        return
+    rev_index = index[::-1]
+    _, first = np.unique(rev_index, return_index=True)
+    array[rev_index[first]] = values[::-1][first]
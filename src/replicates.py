@@ -0,0 +1,251 @@
+"""Lockstep engine running many replicates of the TikTokEchoChamber model on one network.
+
+Instead of one Python object per agent, ReplicateEngine keeps the agents of R replicates in
+(replicate x agent) arrays and the edge weights in (replicate x edge) arrays, and advances all replicates
+still running with a handful of NumPy operations per step. Each replicate has its own random stream
+(spawned from the seed), its own bot placement, and stops on its own once no agent is neutral, so tens or
+hundreds of seeds of a small network run in one process at the cost of a few model objects::
+
+    engine = ReplicateEngine(replicates=100, num_nodes=100, seed=42)
+    engine.run(max_steps=200)
+    engine.state_counts  # (steps + 1, replicates, 3)
+    build_aggregates(engine.rows(), ["positive_chance"])  # see src.aggregates
+
+Agents follow the model's interaction rules, but all of them act on the states at the start of a step and
+their hits are committed together at its end (see commit_interactions), as in the model's "two_phase"
+update mode, while the model by default activates agents one after another in random order. Results are
+statistically comparable, not identical per seed.
+"""
+
+import numpy as np
+
+from src.agents import (
+    BASE_REACH_BOT, BASE_REACH_HUMAN, EDGE_DASHED, EDGE_INVISIBLE, EDGE_VISIBLE, HIT_MID, HIT_REQ, P_NEG,
+    NEGInteraction_LIST, POSInteraction_LIST, State, commit_interactions
+)
+from src.topology import Topology
+
+_POS_WEIGHTS = np.array(POSInteraction_LIST, dtype=np.int32)
+_NEG_WEIGHTS = np.array(NEGInteraction_LIST, dtype=np.int32)
+
+
+class ReplicateEngine:
+    """R independent replicates of the model on the same topology, stepped in lockstep."""
+
+    def __init__(
+            self,
+            replicates=10,
+            num_nodes=10,
+            avg_node_degree=5,
+            num_cons_bots=2,
+            num_prog_bots=3,
+            positive_chance=0.8,
+            become_neutral_chance=0.2,
+            seed=None,
+            graph=None,
+    ):
+        """
+        Create the replicates.
+
+        Args:
+        :param replicates: Number of replicates
+        :param seed: Seed of the network (when generated) and of the replicates' random streams
+        :param graph: Prebuilt network shared by all replicates (a Topology or a path, see Topology.load)
+        Other parameters are the same as TikTokEchoChamber's.
+        """
+        if graph is not None:
+            self.topology = graph if isinstance(graph, Topology) else Topology.load(graph)
+        else:
+            from src.model import TikTokEchoChamber
+
+            self.topology = TikTokEchoChamber.make_topology(num_nodes, avg_node_degree, seed)
+        self.num_nodes = num_nodes = self.topology.num_nodes
+        self.replicates = replicates
+        self.params = {
+            "num_nodes": num_nodes,
+            "avg_node_degree": avg_node_degree,
+            "num_cons_bots": num_cons_bots,
+            "num_prog_bots": num_prog_bots,
+            "positive_chance": positive_chance,
+            "become_neutral_chance": become_neutral_chance,
+            "seed": seed,
+        }
+
+        # determine number of bots for each political leaning, same as the model
+        if num_cons_bots + num_prog_bots > num_nodes:
+            num_cons_bots = num_prog_bots = num_nodes // 2
+        self.max_reach = avg_node_degree
+        self.positive_chance = positive_chance
+        self.become_neutral_chance = become_neutral_chance
+
+        topology = self.topology
+        self._src = topology.sources.astype(np.intp)
+        self._dst = topology.indices.astype(np.intp)
+        self._row_start = topology.indptr[:-1].astype(np.intp)
+        self._pos_in_row = np.arange(len(self._dst)) - self._row_start[self._src]  # k-th neighbour of the source
+        self._degree = topology.degree()
+
+        self.rngs = [np.random.default_rng(s) for s in np.random.SeedSequence(seed).spawn(replicates)]
+
+        # per replicate agent state, one row per replicate
+        self.states = np.full((replicates, num_nodes), State.NEUTRAL, dtype=np.int8)
+        self.is_bot = np.zeros((replicates, num_nodes), dtype=bool)
+        for r, rng in enumerate(self.rngs):
+            bots = rng.permutation(num_nodes)[:num_cons_bots + num_prog_bots]
+            self.is_bot[r, bots] = True
+            self.states[r, bots[:num_cons_bots]] = State.CONSERVATIVE
+            self.states[r, bots[num_cons_bots:]] = State.PROGRESSIVE
+        self.hit_cons = np.zeros((replicates, num_nodes), dtype=np.int32)
+        self.hit_prog = np.zeros((replicates, num_nodes), dtype=np.int32)
+        self.reach = np.where(self.is_bot, BASE_REACH_BOT, BASE_REACH_HUMAN).astype(np.int32)
+        self.edge_weight = np.full((replicates, len(self._dst)), EDGE_INVISIBLE, dtype=np.int8)
+
+        # termination mask: replicates stop once no agent is neutral
+        self.running = np.ones(replicates, dtype=bool)
+        self.stop_step = np.full(replicates, -1)
+        self.steps = 0
+        self._state_counts = [self._count_states()]
+
+    @property
+    def state_counts(self):
+        """(steps + 1, replicates, len(State)) agent counts per state; stopped replicates keep their final counts."""
+        return np.stack(self._state_counts)
+
+    def _count_states(self):
+        offsets = np.arange(self.replicates)[:, None] * len(State)
+        return np.bincount((self.states + offsets).ravel(), minlength=self.replicates * len(State)) \
+            .reshape(self.replicates, len(State))
+
+    def _row_rank(self, mask):
+        """Rank of every masked edge among the masked edges of its source's row (0 for the first)."""
+        cumsum = np.cumsum(mask, axis=1, dtype=np.int32)
+        before = np.zeros((len(mask), self.num_nodes), dtype=np.int32)
+        has_before = self._row_start > 0
+        before[:, has_before] = cumsum[:, self._row_start[has_before] - 1]
+        return cumsum - before[:, self._src] - 1
+
+    def _count_per_source(self, mask):
+        """Number of masked edges of every source node, per replicate."""
+        rows, edges = np.nonzero(mask)
+        n = self.num_nodes
+        return np.bincount(rows * n + self._src[edges], minlength=len(mask) * n).reshape(len(mask), n)
+
+    def step(self):
+        """Advance every running replicate by one step."""
+        active = np.flatnonzero(self.running)
+        if len(active) == 0:
+            return
+        self.steps += 1
+        a = len(active)
+        n = self.num_nodes
+        src, dst = self._src, self._dst
+        num_edges = len(dst)
+
+        # one draw per replicate and step from its own stream, so a replicate's run does not depend on the others
+        draws = np.stack([self.rngs[r].random(2 * n + 3 * num_edges) for r in active])
+        act, coin = draws[:, :n], draws[:, n:2 * n]
+        accept, pick, neutral_draw = draws[:, 2 * n:].reshape(a, 3, num_edges).transpose(1, 0, 2)
+
+        states = self.states[active]
+        is_bot = self.is_bot[active]
+        hit_cons = self.hit_cons[active]
+        hit_prog = self.hit_prog[active]
+        reach = self.reach[active]
+        edge_weight = self.edge_weight[active]
+
+        src_state = states[:, src]
+        dst_state = states[:, dst]
+        src_reach = reach[:, src]
+        negative = ~is_bot & (act < P_NEG)  # humans choose negative or positive, bots are always positive
+        leaning = src_state != State.NEUTRAL
+
+        # positive interactions with the first <reach> dissimilar human neighbours
+        dissimilar = (dst_state != src_state) & ~is_bot[:, dst]
+        positive_edge = ~negative[:, src] & dissimilar & (self._row_rank(dissimilar) < src_reach) & \
+            (accept < self.positive_chance)
+        weight = np.where(
+            positive_edge & leaning & (hit_cons[:, dst] < HIT_REQ + HIT_MID),
+            _POS_WEIGHTS[(pick * len(_POS_WEIGHTS)).astype(np.intp)],
+            0,
+        )
+
+        # negative interactions with the first <reach> neighbours. An agent may turn neutral after every one,
+        #   and no longer hits the neighbours after the one it turned neutral on
+        negative_edge = negative[:, src] & (self._pos_in_row < src_reach)
+        turns_neutral = negative_edge & (neutral_draw < self.become_neutral_chance)
+        first_neutral = np.full(a * n, num_edges, dtype=np.intp)
+        rows, edges = np.nonzero(turns_neutral)
+        np.minimum.at(first_neutral, rows * n + src[edges], self._pos_in_row[edges])
+        first_neutral = first_neutral.reshape(a, n)
+        hits_neg = negative_edge & leaning & (self._pos_in_row <= first_neutral[:, src]) & (hit_cons[:, dst] > 0)
+        weight = np.where(hits_neg, _NEG_WEIGHTS[(pick * len(_NEG_WEIGHTS)).astype(np.intp)], weight)
+        became_neutral = first_neutral < num_edges
+
+        # reach: +1 per positive interaction up to max reach, -1 per negative interaction down to 1
+        num_positive = self._count_per_source(positive_edge)
+        grow = (reach < self.max_reach) & (num_positive > 0)
+        reach = np.where(grow, np.minimum(reach + num_positive, self.max_reach), reach)
+        reach = np.where(negative, np.maximum(1, reach - np.minimum(reach, self._degree)), reach)
+
+        # bots link to neighbouring bots of their leaning while they have reach left; every link adds 3 reach
+        similar_bots = is_bot[:, src] & is_bot[:, dst] & (dst_state == src_state)
+        bot_rank = self._row_rank(similar_bots)
+        num_similar = self._count_per_source(similar_bots)
+        links = np.zeros((a, n), dtype=np.int32)
+        for t in range(int(num_similar.max(initial=0))):
+            linking = (num_similar > t) & (t < reach)
+            links += linking
+            reach = np.where(linking & (reach < self.max_reach), reach + 3, reach)
+        bot_link = similar_bots & (bot_rank < links[:, src])
+
+        # commit the step's hits
+        rows, edges = np.nonzero(weight)
+        connects, disconnects = commit_interactions(
+            states.ravel(), hit_cons.ravel(), hit_prog.ravel(),
+            targets=rows * n + dst[edges],
+            leanings=src_state[rows, edges],
+            weights=weight[rows, edges],
+            became_neutral=became_neutral.ravel(),
+            coin=coin.ravel(),
+        )
+        edge_weight[positive_edge | negative_edge] = EDGE_DASHED
+        edge_weight[bot_link] = EDGE_VISIBLE
+        edge_weight[rows[connects], edges[connects]] = EDGE_VISIBLE
+        edge_weight[rows[disconnects], edges[disconnects]] = EDGE_INVISIBLE
+
+        self.states[active] = states
+        self.hit_cons[active] = hit_cons
+        self.hit_prog[active] = hit_prog
+        self.reach[active] = reach
+        self.edge_weight[active] = edge_weight
+
+        counts = self._count_states()
+        self._state_counts.append(counts)
+        stopped = self.running & (counts[:, State.NEUTRAL] == 0)
+        self.stop_step[stopped] = self.steps
+        self.running &= ~stopped
+
+    def run(self, max_steps=1000):
+        """Step until every replicate stopped or <max_steps> steps were taken."""
+        while self.running.any() and self.steps < max_steps:
+            self.step()
+
+    def rows(self):
+        """Per replicate and step rows in the format of batch_run's results (replicate r is RunId r)."""
+        counts = self.state_counts
+        rows = []
+        for r in range(self.replicates):
+            last = self.stop_step[r] if self.stop_step[r] >= 0 else self.steps
+            stop_reason = "no_neutral" if self.stop_step[r] >= 0 else "max_steps"
+            for step in range(last + 1):
+                rows.append({
+                    "RunId": r,
+                    "iteration": r,
+                    "Step": step,
+                    "StopReason": stop_reason,
+                    **self.params,
+                    "Conservative": int(counts[step, r, State.CONSERVATIVE]),
+                    "Progressive": int(counts[step, r, State.PROGRESSIVE]),
+                    "Neutral": int(counts[step, r, State.NEUTRAL]),
+                })
+        return rows
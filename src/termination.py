@@ -0,0 +1,179 @@
+"""Termination criteria for TikTokEchoChamber runs.
+
+A criterion is called with the model once at the end of every step and returns True when the run
+should stop. Criteria only look at counters the model already keeps up to date (state counts, the
+current step's cluster summary and the number of cluster labels that changed, see ClusterStore), so
+checking them is O(1) per step (amortized for SteadyState's running ranges) apart from cycle detection,
+which is bounded by its window.
+
+Pass a list of criteria as the model's ``termination`` parameter; the first one that fires sets
+``model.stop_reason`` to its ``reason``. Each model works on its own copy of the criteria.
+"""
+
+from collections import deque
+
+from src.agents import State
+
+
+def _state_signature(model):
+    return tuple(model.state_counts)
+
+
+def _cluster_signature(model):
+    stats = model.cluster_stats
+    return stats.num_clusters, stats.num_cons_clusters, stats.num_prog_clusters
+
+
+class NoNeutralAgents:
+    """Stop once no agent is neutral. This is the model's original stopping rule."""
+
+    reason = "no_neutral"
+
+    def __call__(self, model):
+        return model.state_counts[State.NEUTRAL] == 0
+
+
+class _Unchanged:
+    """Stop once changed(model) has returned False for <k> consecutive steps."""
+
+    reason = None
+
+    def __init__(self, changed, k=10):
+        self.changed = changed
+        self.k = k
+        self._count = 0
+
+    def __call__(self, model):
+        self._count = 0 if self.changed(model) else self._count + 1
+        return self._count >= self.k
+
+
+class _SignatureChanged:
+    """Whether signature(model) differs from the one of the previous call."""
+
+    def __init__(self, signature):
+        self.signature = signature
+        self._last = None
+
+    def __call__(self, model):
+        sig = self.signature(model)
+        changed = sig != self._last
+        self._last = sig
+        return changed
+
+
+def _labels_changed(model):
+    return model.cluster_history.last_changed != 0
+
+
+class StateCountsStable(_Unchanged):
+    """Stop once the number of agents in every state has been unchanged for <k> steps."""
+
+    reason = "state_counts_stable"
+
+    def __init__(self, k=10):
+        super().__init__(_SignatureChanged(_state_signature), k)
+
+
+class ClustersStable(_Unchanged):
+    """Stop once no node has changed cluster for <k> steps, i.e. the cluster structure itself (not just the
+    number of clusters) is stable. Uses the count of changed labels the model's cluster history keeps."""
+
+    reason = "clusters_stable"
+
+    def __init__(self, k=10):
+        super().__init__(_labels_changed, k)
+
+
+class _WindowRange:
+    """Minimum and maximum of the last <k> values pushed, in O(1) amortized per push (monotonic deques)."""
+
+    def __init__(self, k):
+        self.k = k
+        self._pushed = 0
+        self._min = deque()  # (index, value), values increasing
+        self._max = deque()  # (index, value), values decreasing
+
+    def push(self, value):
+        index = self._pushed
+        self._pushed += 1
+        while self._min and self._min[-1][1] >= value:
+            self._min.pop()
+        self._min.append((index, value))
+        while self._max and self._max[-1][1] <= value:
+            self._max.pop()
+        self._max.append((index, value))
+        oldest = index - self.k + 1
+        if self._min[0][0] < oldest:
+            self._min.popleft()
+        if self._max[0][0] < oldest:
+            self._max.popleft()
+
+    @property
+    def full(self):
+        return self._pushed >= self.k
+
+    @property
+    def range(self):
+        return self._max[0][1] - self._min[0][1]
+
+
+class SteadyState:
+    """Stop once state counts and cluster counts have all stayed within +-<tol> of the middle of their range
+    for <k> steps, i.e. the run fluctuates in a bounded band instead of going anywhere. This is how most runs
+    end: try_gain_neutrality keeps turning agents neutral and their neighbours keep pulling them back, so the
+    counts never settle exactly and the other criteria never fire.
+
+    <tol> is a fraction of the number of nodes, or a number of agents (clusters) with <abs_tol>. The defaults
+    stop 200-node runs between about 70 and 330 steps in, once the leaning that wins is decided; a shorter
+    window or a wider band can stop a run before a late takeover by the other leaning.
+    """
+
+    reason = "steady_state"
+
+    def __init__(self, k=50, tol=0.05, abs_tol=None):
+        self.k = k
+        self.tol = tol
+        self.abs_tol = abs_tol
+        self._ranges = None
+
+    def __call__(self, model):
+        signature = _state_signature(model) + _cluster_signature(model)
+        if self._ranges is None:
+            self._ranges = [_WindowRange(self.k) for _ in signature]
+        for window, value in zip(self._ranges, signature):
+            window.push(value)
+        if not self._ranges[0].full:
+            return False
+        tol = self.abs_tol if self.abs_tol is not None else self.tol * model.num_nodes
+        return all(window.range <= 2 * tol for window in self._ranges)
+
+
+class MetricCycle:
+    """Stop once state counts and cluster counts repeat a cycle of 2 to <max_period> steps <repeats> times
+    in a row, e.g. agents flipping back and forth between neutral and a leaning. Constant counts (period 1)
+    are left to StateCountsStable and ClustersStable, which wait longer before calling a run settled, and
+    cycles that do not repeat exactly to SteadyState."""
+
+    reason = "metric_cycle"
+
+    def __init__(self, max_period=4, repeats=3):
+        self.max_period = max_period
+        self.repeats = repeats
+        self._history = deque(maxlen=max_period * repeats)
+
+    def __call__(self, model):
+        self._history.append(_state_signature(model) + _cluster_signature(model))
+        history = list(self._history)
+        for period in range(2, self.max_period + 1):
+            window = period * self.repeats
+            if len(history) < window:
+                break
+            recent = history[-window:]
+            # a constant signal repeats with every period, but is not a cycle
+            if len(set(recent[:period])) > 1 and all(recent[i] == recent[i - period] for i in range(period, window)):
+                return True
+        return False
+
+
+DEFAULT_TERMINATION = (NoNeutralAgents(),)
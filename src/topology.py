@@ -0,0 +1,288 @@
+"""Network topology of a TikTokEchoChamber model stored as compressed sparse rows (CSR).
+
+The neighbours of node u are ``indices[indptr[u]:indptr[u + 1]]``, sorted. Every undirected edge is
+stored once in each direction, so a position in ``indices`` doubles as the id of a directed edge, and
+per-edge model state (like edge weights) lives in flat arrays indexed by that id.
+
+Large real-world graphs (e.g. scraped follower graphs) are converted once from a text edge list into
+binary CSR files next to it, which are then memory-mapped read-only::
+
+    prefix = Topology.convert("followers.txt")  # writes followers.indptr.npy, followers.indices.npy, ...
+    topology = Topology.open(prefix)
+
+Every model or process opening the same files shares the operating system's cached pages instead of
+holding its own copy of the graph. Generated graphs can be shared with worker processes the same way
+through SharedTopology, which copies the arrays into shared memory blocks once.
+"""
+
+import os
+import random
+
+import numpy as np
+
+
+class Topology:
+    """Undirected graph in CSR form."""
+
+    # arrays written by convert() and memory-mapped by open()
+    FILES = ("indptr", "indices", "sources", "reverse", "node_ids")
+
+    def __init__(self, indptr, indices, sources=None, reverse=None, node_ids=None):
+        self.indptr = indptr
+        self.indices = indices
+        self._sources = sources
+        self._reverse = reverse
+        # original id of every node when the graph was read from an edge list with arbitrary node ids
+        self.node_ids = node_ids
+
+    @property
+    def num_nodes(self):
+        return len(self.indptr) - 1
+
+    @property
+    def num_edges(self):
+        """Number of undirected edges."""
+        return len(self.indices) // 2
+
+    def degree(self):
+        return np.diff(self.indptr)
+
+    def neighbors(self, node):
+        return self.indices[self.indptr[node]:self.indptr[node + 1]]
+
+    @property
+    def sources(self):
+        """Source node of every directed edge."""
+        if self._sources is None:
+            self._sources = np.repeat(np.arange(self.num_nodes, dtype=self.indices.dtype), self.degree())
+        return self._sources
+
+    @property
+    def reverse(self):
+        """Id of the v -> u edge for every u -> v edge."""
+        if self._reverse is None:
+            # rows and the neighbours within each row are sorted, so (source, target) keys are sorted
+            n = np.int64(self.num_nodes)
+            keys = self.sources.astype(np.int64) * n + self.indices
+            self._reverse = np.searchsorted(keys, self.indices.astype(np.int64) * n + self.sources)
+        return self._reverse
+
+    def edge_id(self, u, v):
+        """Id of the directed edge u -> v."""
+        lo = self.indptr[u]
+        return int(lo + np.searchsorted(self.indices[lo:self.indptr[u + 1]], v))
+
+    @classmethod
+    def from_edges(cls, src, dst, num_nodes=None):
+        """Build from arrays of undirected edge endpoints. Self loops and duplicate edges are dropped."""
+        src = np.asarray(src, dtype=np.int64)
+        dst = np.asarray(dst, dtype=np.int64)
+        if num_nodes is None:
+            num_nodes = int(max(src.max(initial=-1), dst.max(initial=-1))) + 1
+        keep = src != dst
+        rows = np.concatenate([src[keep], dst[keep]])
+        cols = np.concatenate([dst[keep], src[keep]])
+
+        keys = np.unique(rows * num_nodes + cols)
+        rows, cols = np.divmod(keys, num_nodes)
+        indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=num_nodes), out=indptr[1:])
+        index_dtype = np.int32 if num_nodes < 2 ** 31 else np.int64
+        return cls(indptr, cols.astype(index_dtype))
+
+    @classmethod
+    def powerlaw_cluster(cls, n, m, p, seed=None):
+        """Holme and Kim power law graph with clustering, same algorithm and random draws as
+        networkx.powerlaw_cluster_graph (so a seed gives the same graph), but built on plain
+        insertion ordered adjacency dicts and written straight into CSR arrays.
+
+        The generator itself is still a Python loop over the edges and about as fast as networkx's
+        (~4s at n=10^5, m=5); what it saves is the NetworkGrid, directed copy and per-edge attribute
+        dicts the model used to build on top of the networkx graph. Neighbours come out sorted, not in
+        networkx's insertion order, so the agents' "first <reach> neighbours" differ from a model run
+        on the networkx graph with the same seeds."""
+        if m < 1 or n < m:
+            raise ValueError(f"must have m>1 and m<n, m={m},n={n}")
+        if p > 1 or p < 0:
+            raise ValueError(f"p must be in [0,1], p={p}")
+        rng = random.Random(seed)
+        choice = rng.choice
+        rand = rng.random
+
+        adj = [dict() for _ in range(n)]
+        src = []
+        dst = []
+
+        def add_edge(u, v):
+            if v not in adj[u]:
+                adj[u][v] = None
+                adj[v][u] = None
+                src.append(u)
+                dst.append(v)
+
+        repeated_nodes = list(range(m))  # nodes repeated once for each adjacent edge
+        for source in range(m, n):
+            # m unique preferential attachment targets
+            possible_targets = set()
+            while len(possible_targets) < m:
+                possible_targets.add(choice(repeated_nodes))
+
+            target = possible_targets.pop()
+            add_edge(source, target)
+            repeated_nodes.append(target)
+            count = 1
+            source_adj = adj[source]
+            while count < m:
+                if rand() < p:  # clustering step: add triangle
+                    neighborhood = [nbr for nbr in adj[target] if nbr not in source_adj and nbr != source]
+                    if neighborhood:
+                        nbr = choice(neighborhood)
+                        add_edge(source, nbr)
+                        repeated_nodes.append(nbr)
+                        count += 1
+                        continue
+                # else do preferential attachment step
+                target = possible_targets.pop()
+                add_edge(source, target)
+                repeated_nodes.append(target)
+                count += 1
+            repeated_nodes.extend([source] * m)
+
+        return cls.from_edges(np.array(src, dtype=np.int64), np.array(dst, dtype=np.int64), n)
+
+    @classmethod
+    def from_edge_list(cls, path, num_nodes=None):
+        """Read a whitespace separated text edge list ("u v" per line, # comments) of 0-indexed nodes."""
+        edges = np.loadtxt(path, dtype=np.int64, comments="#", usecols=(0, 1), ndmin=2)
+        return cls.from_edges(edges[:, 0], edges[:, 1], num_nodes)
+
+    @staticmethod
+    def convert(path, prefix=None, chunk_lines=1_000_000):
+        """Convert a text edge list with arbitrary integer node ids into binary CSR files.
+
+        Edges are read <chunk_lines> lines at a time, treated as undirected (a follow in either direction
+        makes two users neighbours), de-duplicated, and node ids are renumbered 0..n-1 in sorted order of the
+        original ids, which are kept in <prefix>.node_ids.npy. Returns the prefix of the written files,
+        by default <path> without its extension.
+        """
+        if prefix is None:
+            prefix = os.path.splitext(path)[0]
+
+        chunks = []
+        with open(path) as f:
+            while True:
+                lines = [line for _, line in zip(range(chunk_lines), f)]
+                if not lines:
+                    break
+                chunk = np.loadtxt(lines, dtype=np.int64, comments="#", usecols=(0, 1), ndmin=2)
+                if len(chunk):
+                    chunks.append(chunk)
+        edges = np.concatenate(chunks) if chunks else np.empty((0, 2), dtype=np.int64)
+
+        node_ids, edges = np.unique(edges, return_inverse=True)
+        edges = edges.reshape(-1, 2)
+        topology = Topology.from_edges(edges[:, 0], edges[:, 1], len(node_ids))
+        topology.node_ids = node_ids
+        for name in Topology.FILES:
+            np.save(f"{prefix}.{name}.npy", getattr(topology, name))
+        return prefix
+
+    @classmethod
+    def open(cls, prefix):
+        """Memory-map the read-only CSR files written by convert()."""
+        arrays = {name: np.load(f"{prefix}.{name}.npy", mmap_mode="r") for name in cls.FILES}
+        return cls(**arrays)
+
+    @classmethod
+    def load(cls, path):
+        """Load a topology from <path>: a saved .npz, the prefix of converted CSR files (memory-mapped), or a
+        text edge list. An edge list is converted to CSR files next to it on first use (and again whenever it
+        is newer than them), then memory-mapped."""
+        path = str(path)
+        if path.endswith(".npz"):
+            data = np.load(path)
+            return cls(data["indptr"], data["indices"], node_ids=data["node_ids"] if "node_ids" in data else None)
+        if os.path.exists(f"{path}.indptr.npy"):
+            return cls.open(path)
+        prefix = os.path.splitext(path)[0]
+        converted = f"{prefix}.{cls.FILES[-1]}.npy"
+        if not os.path.exists(converted) or os.path.getmtime(converted) < os.path.getmtime(path):
+            cls.convert(path, prefix)
+        return cls.open(prefix)
+
+    def node_index(self, node_ids):
+        """Node indices of the given original node ids (identity when the graph has no node id map)."""
+        node_ids = np.asarray(node_ids, dtype=np.int64)
+        if self.node_ids is None:
+            missing = (node_ids < 0) | (node_ids >= self.num_nodes)
+            if missing.any():
+                raise ValueError(f"node ids not in the graph: {node_ids[missing][:10].tolist()}")
+            return node_ids
+        index = np.searchsorted(self.node_ids, node_ids)
+        index = np.minimum(index, len(self.node_ids) - 1)
+        missing = self.node_ids[index] != node_ids
+        if missing.any():
+            raise ValueError(f"node ids not in the graph: {node_ids[missing][:10].tolist()}")
+        return index
+
+    def save(self, path):
+        """Save to a .npz, with the node id map when the graph has one."""
+        extra = {"node_ids": self.node_ids} if self.node_ids is not None else {}
+        np.savez(path, indptr=self.indptr, indices=self.indices, **extra)
+
+    def to_networkx(self):
+        import networkx as nx
+
+        G = nx.Graph()
+        G.add_nodes_from(range(self.num_nodes))
+        mask = self.sources < self.indices
+        G.add_edges_from(zip(self.sources[mask].tolist(), self.indices[mask].tolist()))
+        return G
+
+
+class SharedTopology:
+    """A Topology published in multiprocessing.shared_memory blocks.
+
+    Pickle ``spec`` (block names, shapes and dtypes) to worker processes and call attach() there to get a
+    Topology backed by the shared blocks, without copying. The publishing process owns the blocks and
+    must close() once the workers are done.
+    """
+
+    def __init__(self, topology):
+        from multiprocessing import shared_memory
+
+        self._blocks = []
+        self.spec = {}
+        for name in Topology.FILES:
+            array = getattr(topology, name)  # computes the lazy sources and reverse arrays once, here
+            if array is None:
+                continue
+            array = np.ascontiguousarray(array)
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, array.dtype, buffer=block.buf)[...] = array
+            self._blocks.append(block)
+            self.spec[name] = (block.name, array.shape, array.dtype.str)
+
+    @staticmethod
+    def attach(spec):
+        """Topology whose arrays are read-only views of the shared blocks described by <spec>."""
+        from multiprocessing import shared_memory
+
+        blocks = []
+        arrays = {}
+        for name, (block_name, shape, dtype) in spec.items():
+            block = shared_memory.SharedMemory(name=block_name)
+            array = np.ndarray(shape, dtype, buffer=block.buf)
+            array.flags.writeable = False
+            blocks.append(block)
+            arrays[name] = array
+        topology = Topology(**arrays)
+        topology._shared_blocks = blocks  # the mappings must live as long as the arrays
+        return topology
+
+    def close(self):
+        """Release and remove the shared blocks."""
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+        self._blocks = []